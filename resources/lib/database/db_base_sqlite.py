@@ -6,11 +6,14 @@
     SPDX-License-Identifier: MIT
     See LICENSES/MIT.md for more information.
 """
+import queue
 import sqlite3 as sql
+import sys
 import threading
+import weakref
+from contextlib import contextmanager
 from functools import wraps
 
-from resources.lib.helpers import utils
 from resources.lib.helpers import data_conversion
 import resources.lib.database.db_create_sqlite as db_create_sqlite
 import resources.lib.database.db_utils as db_utils
@@ -18,6 +21,12 @@ from resources.lib.helpers.exceptions import DBSQLiteConnectionError, DBSQLiteEr
 from resources.lib.helpers.logging import LOG
 
 CONN_ISOLATION_LEVEL = None  # Autocommit mode
+# Size of the per-connection prepared statement LRU cache (sqlite3 default is 100),
+# large enough to keep all the recurring queries always prepared
+STATEMENT_CACHE_SIZE = 256
+
+# sqlite UPSERT clause exists only on sqlite >= 3.24.0, the version cannot change at runtime
+_HAS_UPSERT = sql.sqlite_version_info >= (3, 24, 0)
 
 # ---------------------------------------------------------------------------
 # Pay attention with the SQLite syntax:
@@ -27,92 +36,213 @@ CONN_ISOLATION_LEVEL = None  # Autocommit mode
 # ---------------------------------------------------------------------------
 
 
-def handle_connection(func):
+def _apply_pragmas(conn):
+    """
+    Apply the tuning PRAGMAs to a connection
+    WAL journal allow concurrent readers while a write is in progress and avoids one fsync per commit,
+    'synchronous' NORMAL is safe with WAL and halves the fsync cost,
+    'busy_timeout' avoids "database is locked" errors when a writer is busy
     """
-    A decorator that handle the connection status with the database
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-8000')
+
+
+def handle_read_op(func):
+    """
+    A decorator for the read operations, no lock is taken:
+    under WAL the pooled read-only connections see a consistent snapshot
+    also while a write is in progress
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
         if args[0].is_mysql_database:
             # If database is mysql pass to next decorator
             return func(*args, **kwargs)
-        conn = None
         try:
-            if not args[0].is_connected:
-                args[0].mutex.acquire()
-                args[0].conn = sql.connect(args[0].db_file_path,
-                                           isolation_level=CONN_ISOLATION_LEVEL)
-                args[0].is_connected = True
-                conn = args[0].conn
+            return func(*args, **kwargs)
+        except sql.Error as exc:
+            LOG.error('SQLite error: {}', exc)
+            raise DBSQLiteConnectionError from exc
+    return wrapper
+
 
+def handle_write_op(func):
+    """
+    A decorator for the write operations, serializes the writers on the
+    shared write connection without blocking the readers
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if args[0].is_mysql_database:
+            # If database is mysql pass to next decorator
             return func(*args, **kwargs)
+        try:
+            with args[0].mutex:
+                return func(*args, **kwargs)
         except sql.Error as exc:
-            LOG.error('SQLite error {}:', exc.args[0])
+            LOG.error('SQLite error: {}', exc)
             raise DBSQLiteConnectionError from exc
-        finally:
-            if conn:
-                args[0].is_connected = False
-                conn.close()
-                args[0].mutex.release()
     return wrapper
 
 
 class SQLiteDatabase:
     # Table mapping: ( Table name, [ columns ] )
     TABLE_CONFIG = ('config', ['Name', 'Value'])
+    # Pre-baked SQL strings for the default TABLE_CONFIG (the schema is fixed),
+    # so the default path skips the dynamic formatting entirely
+    _CFG_SQL = {
+        'select': 'SELECT Value FROM config WHERE Name = ?',
+        'update': 'UPDATE config SET Value = ? WHERE Name = ?',
+        'insert': 'INSERT INTO config (Name, Value) VALUES (?, ?)',
+        'replace': 'INSERT OR REPLACE INTO config (Name, Value) VALUES (?, ?)',
+        'upsert_value': ('INSERT INTO config (Name, Value) VALUES (?, ?) '
+                         'ON CONFLICT(Name) DO UPDATE SET Value = excluded.Value'),
+        'upsert_values': ('INSERT INTO config (Name, Value) VALUES (?, ?) '
+                          'ON CONFLICT(Name) DO UPDATE SET Value = ? WHERE Name = ?'),
+        'delete': 'DELETE FROM config WHERE Name = ?',
+    }
+    # Number of pooled read-only connections ("1 writer + N readers" pattern),
+    # so the read operations do not have to queue up behind a writer
+    POOL_READERS = 3
 
     def __init__(self, db_filename):  # pylint: disable=super-on-old-class
         self.conn = None
         self.mutex = threading.Lock()
-        self.local_storage = threading.local()
+        # Per-thread cursor cache, keyed on the Thread object itself: a WeakKeyDictionary
+        # lookup is cheaper than threading.local attribute access and the entries
+        # disappear automatically when a thread dies
+        self._tls_cursors = weakref.WeakKeyDictionary()
         self.is_mysql_database = False
         self.db_filename = db_filename
         self.db_file_path = db_utils.get_local_db_path(db_filename)
+        self._read_pool = queue.Queue()
+        self._sql_cache = {}  # Formatted SQL strings, keyed by (operation, table name)
         self.initialize_connection()
 
-    @property
-    def is_connected(self):
-        return getattr(self.local_storage, 'is_connected', False)
-
-    @is_connected.setter
-    def is_connected(self, val):
-        self.local_storage.is_connected = val
-
     def initialize_connection(self):
-        """Checks database existence and performs first connection tests"""
+        """Open the persistent connection and create the table schema if missing"""
         try:
             LOG.debug('Trying connection to the database {}', self.db_filename)
-            self.conn = sql.connect(self.db_file_path, check_same_thread=False)
-            cur = self.conn.cursor()
-            cur.execute(str('SELECT SQLITE_VERSION()'))
+            self.conn = sql.connect(self.db_file_path,
+                                    check_same_thread=False,
+                                    isolation_level=CONN_ISOLATION_LEVEL,
+                                    cached_statements=STATEMENT_CACHE_SIZE)
+            if self.db_filename != ':memory:':
+                _apply_pragmas(self.conn)
+            cur = self.conn.execute(str('SELECT SQLITE_VERSION()'))
             LOG.debug('Database connection {} was successful (SQLite ver. {})',
                       self.db_filename, cur.fetchone()[0])
-            cur.row_factory = lambda cursor, row: row[0]
-            cur.execute(str('SELECT name FROM sqlite_master WHERE type=\'table\' '
-                            'AND name NOT LIKE \'sqlite_%\''))
-            list_tables = cur.fetchall()
-            if not list_tables:
-                # If no tables exist create a new one
-                self.conn.close()
-                db_create_sqlite.create_database(self.db_file_path, self.db_filename)
+            db_create_sqlite.create_schema(self.conn)
+            self._fill_read_pool()
         except sql.Error as exc:
-            LOG.error('SQLite error {}:', exc.args[0])
+            LOG.error('SQLite error: {}', exc)
             raise DBSQLiteConnectionError from exc
+
+    def _get_sql(self, operation, table):
+        """
+        Get the formatted SQL string for an operation, built only once per (operation, table)
+        :param operation: name of the operation
+        :param table: Table map
+        :return: the SQL string
+        """
+        if table is self.TABLE_CONFIG:
+            return self._CFG_SQL[operation]
+        table_name = table[0]
+        query = self._sql_cache.get((operation, table_name))
+        if query is None:
+            table_columns = table[1]
+            if operation == 'select':
+                query = 'SELECT {} FROM {} WHERE {} = ?'.format(table_columns[1],
+                                                                table_name,
+                                                                table_columns[0])
+            elif operation == 'update':
+                query = 'UPDATE {} SET {} = ? WHERE {} = ?'.format(table_name,
+                                                                   table_columns[1],
+                                                                   table_columns[0])
+            elif operation == 'insert':
+                query = 'INSERT INTO {} ({}, {}) VALUES (?, ?)'.format(table_name,
+                                                                       table_columns[0],
+                                                                       table_columns[1])
+            elif operation == 'replace':
+                query = 'INSERT OR REPLACE INTO {} ({}, {}) VALUES (?, ?)'.format(table_name,
+                                                                                  table_columns[0],
+                                                                                  table_columns[1])
+            elif operation == 'upsert_value':
+                query = ('INSERT INTO {tbl_name} ({tbl_col1}, {tbl_col2}) VALUES (?, ?) '
+                         'ON CONFLICT({tbl_col1}) DO UPDATE SET '
+                         '{tbl_col2} = excluded.{tbl_col2}').format(tbl_name=table_name,
+                                                                    tbl_col1=table_columns[0],
+                                                                    tbl_col2=table_columns[1])
+            elif operation == 'upsert_values':
+                query = ('INSERT INTO {tbl_name} ({tbl_col1}, {tbl_col2}) VALUES (?, ?) '
+                         'ON CONFLICT({tbl_col1}) DO UPDATE SET {tbl_col2} = ? '
+                         'WHERE {tbl_col1} = ?').format(tbl_name=table_name,
+                                                        tbl_col1=table_columns[0],
+                                                        tbl_col2=table_columns[1])
+            elif operation == 'delete':
+                query = 'DELETE FROM {} WHERE {} = ?'.format(table_name, table_columns[0])
+            else:
+                raise ValueError('SQL operation {} not mapped'.format(operation))
+            # Interning makes the statement-cache string compare a pointer check
+            query = sys.intern(query)
+            self._sql_cache[(operation, table_name)] = query
+        return query
+
+    def _fill_read_pool(self):
+        """Open the pool of read-only connections"""
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
+        for _ in range(self.POOL_READERS):
+            conn = sql.connect(self.db_file_path,
+                               check_same_thread=False,
+                               isolation_level=CONN_ISOLATION_LEVEL,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+            if self.db_filename != ':memory:':
+                _apply_pragmas(conn)
+                conn.execute('PRAGMA query_only=1')
+            self._read_pool.put(conn)
+
+    @contextmanager
+    def _read_conn(self):
+        """Borrow a read-only connection from the pool"""
+        conn = self._read_pool.get()
+        try:
+            yield conn
         finally:
-            if self.conn:
-                self.conn.close()
+            self._read_pool.put(conn)
+
+    def optimize(self):
+        """Refresh the query planner statistics, near-zero cost when run periodically"""
+        if self.is_mysql_database or not self.conn:
+            return
+        try:
+            self.conn.execute('PRAGMA optimize;')
+        except sql.Error as exc:
+            LOG.error('SQLite error: {}', exc)
+
+    def close_connections(self):
+        """Close the persistent connection and the read-only connections pool"""
+        if self.conn:
+            # Persist the query planner statistics before service exit
+            self.optimize()
+            self.conn.close()
+            self.conn = None
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
 
     def _executemany_non_query(self, query, params, cursor=None):
         try:
-            if cursor is None:
-                cursor = self.get_cursor()
-            cursor.executemany(query, params)
+            # Connection.executemany reuses an implicit cursor, avoids a cursor allocation per call
+            target = cursor if cursor is not None else self.conn
+            target.executemany(query, params)
         except sql.Error as exc:
-            LOG.error('SQLite error {}:', exc.args[0])
+            LOG.error('SQLite error: {}', exc)
             raise DBSQLiteError from exc
         except ValueError:
-            LOG.error('Value {}', str(params))
-            LOG.error('Value type {}', type(params))
+            LOG.error('Value {} (type {})', params, type(params))
             raise
 
     def _execute_non_query(self, query, params=None, cursor=None, **kwargs):
@@ -120,21 +250,19 @@ class SQLiteDatabase:
         Execute a query without returning a value
         :param query: sql query
         :param params: tuple of values
-        :param cursor: a cursor, if None get a instance of standard cursor
+        :param cursor: a cursor, if None the connection implicit cursor is used
         """
         try:
-            if cursor is None:
-                cursor = self.get_cursor()
+            target = cursor if cursor is not None else self.conn
             if params is not None:
-                cursor.execute(query, params)
+                target.execute(query, params)
             else:
-                cursor.execute(query)
+                target.execute(query)
         except sql.Error as exc:
-            LOG.error('SQLite error {}:', exc.args[0])
+            LOG.error('SQLite error: {}', exc)
             raise DBSQLiteError from exc
         except ValueError:
-            LOG.error('Value {}', str(params))
-            LOG.error('Value type {}', type(params))
+            LOG.error('Value {} (type {})', params, type(params))
             raise
 
     def _execute_query(self, query, params=None, cursor=None):
@@ -142,39 +270,41 @@ class SQLiteDatabase:
         Execute a query returning a value
         :param query: sql query
         :param params: tuple of values
-        :param cursor: a cursor, if None get a instance of standard cursor
+        :param cursor: a cursor, if None the connection implicit cursor is used
         :return: query result
         """
         try:
-            if cursor is None:
-                cursor = self.get_cursor()
+            target = cursor if cursor is not None else self.conn
             if params is not None:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            return cursor
+                return target.execute(query, params)
+            return target.execute(query)
         except sql.Error as exc:
-            LOG.error('SQLite error {}:', exc.args[0])
+            LOG.error('SQLite error: {}', exc)
             raise DBSQLiteError from exc
         except ValueError:
-            LOG.error('Value {}', str(params))
-            LOG.error('Value type {}', type(params))
+            LOG.error('Value {} (type {})', params, type(params))
             raise
 
     def get_cursor(self):
         """
-        Get an instance of standard cursor
+        Get an instance of standard cursor (cached per-thread)
         :return: cursor
         """
-        return self.conn.cursor()
+        thread = threading.current_thread()
+        cursor = self._tls_cursors.get(thread)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            self._tls_cursors[thread] = cursor
+        return cursor
 
     def get_cursor_for_dict_results(self):
         """
-        Get an instance of cursor to obtain results as a dictionary
+        Get an instance of cursor to obtain results accessible by column name
         :return: cursor
         """
         conn_cursor = self.conn.cursor()
-        conn_cursor.row_factory = lambda c, r: dict(list(zip([col[0] for col in c.description], r)))
+        # sqlite3.Row is C-implemented and avoids a Python callback + dict allocation per row
+        conn_cursor.row_factory = sql.Row
         return conn_cursor
 
     def get_cursor_for_list_results(self):
@@ -183,18 +313,17 @@ class SQLiteDatabase:
         to use in conjunction with: return_rows_as_list
         :return: cursor
         """
-        conn_cursor = self.conn.cursor()
-        conn_cursor.row_factory = lambda cursor, row: row[0]
-        return conn_cursor
+        # The default tuple row factory is the fastest, the rows are unpacked by return_rows_as_list
+        return self.conn.cursor()
 
     def return_rows_as_list(self, conn_cursor):
         """
         Convert rows to a list when necessary (MySql)
         :return: list
         """
-        return conn_cursor.fetchall()
+        return [row[0] for row in conn_cursor.fetchall()]
 
-    @handle_connection
+    @handle_read_op
     def get_value(self, key, default_value=None, table=TABLE_CONFIG, data_type=None):
         """
         Get a single value from database
@@ -204,13 +333,10 @@ class SQLiteDatabase:
         :param data_type: OPTIONAL If default_value is None, you can specify the type of data returned here
         :return: The value converted with data type of default_value, or with the data_type specified
         """
-        table_name = table[0]
-        table_columns = table[1]
-        query = 'SELECT {} FROM {} WHERE {} = ?'.format(table_columns[1],
-                                                        table_name,
-                                                        table_columns[0])
-        cur = self._execute_query(query, (key,))
-        result = cur.fetchone()
+        query = self._get_sql('select', table)
+        with self._read_conn() as conn:
+            cur = self._execute_query(query, (key,), conn.cursor())
+            result = cur.fetchone()
         if default_value is not None:
             data_type = type(default_value)
         elif data_type is None:
@@ -218,7 +344,7 @@ class SQLiteDatabase:
         return data_conversion.convert_from_string(result[0], data_type) \
             if result is not None else default_value
 
-    @handle_connection
+    @handle_read_op
     def get_values(self, key, default_value=None, table=TABLE_CONFIG):
         """
         Get multiple values from database - WARNING return row objects
@@ -227,16 +353,13 @@ class SQLiteDatabase:
         :param table: Table map
         :return: rows
         """
-        table_name = table[0]
-        table_columns = table[1]
-        query = 'SELECT {} FROM {} WHERE {} = ?'.format(table_columns[1],
-                                                        table_name,
-                                                        table_columns[0])
-        cur = self._execute_query(query, (key,))
-        result = cur.fetchall()
+        query = self._get_sql('select', table)
+        with self._read_conn() as conn:
+            cur = self._execute_query(query, (key,), conn.cursor())
+            result = cur.fetchall()
         return result if result is not None else default_value
 
-    @handle_connection
+    @handle_write_op
     def set_value(self, key, value, table=TABLE_CONFIG):
         """
         Store a single value to database
@@ -244,52 +367,40 @@ class SQLiteDatabase:
         :param value: Value to save
         :param table: Table map
         """
-        table_name = table[0]
-        table_columns = table[1]
-        # Update or insert approach, if there is no updated row then insert new one (no id changes)
-        update_query = 'UPDATE {} SET {} = ? WHERE {} = ?'.format(table_name,
-                                                                  table_columns[1],
-                                                                  table_columns[0])
         value = data_conversion.convert_to_string(value)
-        cur = self._execute_query(update_query, (value, key))
-        if cur.rowcount == 0:
-            insert_query = 'INSERT INTO {} ({}, {}) VALUES (?, ?)'\
-                .format(table_name, table_columns[0], table_columns[1])
-            self._execute_non_query(insert_query, (key, value))
+        if _HAS_UPSERT:
+            # The UPSERT clause is a single statement (no id changes)
+            self._execute_non_query(self._get_sql('upsert_value', table), (key, value))
+        else:
+            # Update or insert approach, if there is no updated row then insert new one (no id changes)
+            cur = self._execute_query(self._get_sql('update', table), (value, key))
+            if cur.rowcount == 0:
+                self._execute_non_query(self._get_sql('insert', table), (key, value))
 
-    @handle_connection
+    @handle_write_op
     def set_values(self, dict_values, table=TABLE_CONFIG):
         """
         Store multiple values to database
         :param dict_values: The key/value to store
         :param table: Table map
         """
-        table_name = table[0]
-        table_columns = table[1]
         # Doing many sqlite operations at the same makes the performance much worse (especially on Kodi 18)
         # The use of 'executemany' and 'transaction' can improve performance up to about 75% !!
-        if utils.is_less_version(sql.sqlite_version, '3.24.0'):
-            query = 'INSERT OR REPLACE INTO {} ({}, {}) VALUES (?, ?)'.format(table_name,
-                                                                              table_columns[0],
-                                                                              table_columns[1])
-            records_values = [(key, data_conversion.convert_to_string(value)) for key, value in dict_values.items()]
+        if _HAS_UPSERT:
+            query = self._get_sql('upsert_values', table)
+            records_values = ((key, (value_str := data_conversion.convert_to_string(value)), value_str, key)
+                              for key, value in dict_values.items())
         else:
-            # sqlite UPSERT clause exists only on sqlite >= 3.24.0
-            query = ('INSERT INTO {tbl_name} ({tbl_col1}, {tbl_col2}) VALUES (?, ?) '
-                     'ON CONFLICT({tbl_col1}) DO UPDATE SET {tbl_col2} = ? '
-                     'WHERE {tbl_col1} = ?').format(tbl_name=table_name,
-                                                    tbl_col1=table_columns[0],
-                                                    tbl_col2=table_columns[1])
-            records_values = []
-            for key, value in dict_values.items():
-                value_str = data_conversion.convert_to_string(value)
-                records_values.append((key, value_str, value_str, key))
-        cur = self.get_cursor()
-        cur.execute("BEGIN TRANSACTION;")
-        self._executemany_non_query(query, records_values, cur)
-        cur.execute("COMMIT;")
-
-    @handle_connection
+            query = self._get_sql('replace', table)
+            records_values = ((key, data_conversion.convert_to_string(value)) for key, value in dict_values.items())
+        # The connection is in autocommit mode, then the transaction must be opened explicitly,
+        # the connection context manager commits it on exit (or rolls it back on error)
+        with self.conn:
+            cur = self.get_cursor()
+            cur.execute('BEGIN TRANSACTION;')
+            self._executemany_non_query(query, records_values, cur)
+
+    @handle_write_op
     def delete_key(self, key, table=TABLE_CONFIG):
         """
         Delete a key record from database
@@ -297,12 +408,8 @@ class SQLiteDatabase:
         :param table: Table map
         :return: Number of deleted entries
         """
-        table_name = table[0]
-        table_columns = table[1]
-        query = 'DELETE FROM {} WHERE {} = ?'.format(table_name, table_columns[0])
-        cur = self._execute_query(query, (key,))
+        cur = self._execute_query(self._get_sql('delete', table), (key,))
         return cur.rowcount
 
     def __del__(self):
-        if self.conn:
-            self.conn.close()
+        self.close_connections()
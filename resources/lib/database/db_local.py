@@ -17,6 +17,8 @@ class NFLocalDatabase(db_sqlite.SQLiteDatabase):
 
     def reset_database(self):
         """Delete the entire database and recreate it from scratch"""
+        # The connections are persistent, close them before delete the file
+        self.close_connections()
         if file_ops.file_exists(self.db_file_path):
             file_ops.delete_file(self.db_file_path)
         self.initialize_connection()
@@ -6,18 +6,20 @@
     See LICENSES/MIT.md for more information.
 """
 import os
+from functools import lru_cache
 
 import xbmcvfs
 
 from resources.lib.globals import G
+from resources.lib.helpers.file_ops import folder_exists
 
 
 LOCAL_DB_FILENAME = 'database.sqlite3'
 
 
+@lru_cache(maxsize=None)
 def get_local_db_path(db_filename):
-    # First ensure database folder exists
-    from resources.lib.helpers.file_ops import folder_exists
+    # First ensure database folder exists (the path is invariant per process, then is memoized)
     db_folder = xbmcvfs.translatePath(os.path.join(G.DATA_PATH, 'database'))
     if not folder_exists(db_folder):
         xbmcvfs.mkdirs(db_folder)
@@ -31,18 +33,13 @@ def sql_filtered_update(table, set_columns, where_columns, values):
     If the values are positioned incorrectly with respect to the column names,
     they will be saved in the wrong column!
     """
-    for index in range(len(set_columns) - 1, -1, -1):
-        if values[index] is None:
-            del set_columns[index]
-            del values[index]
-    set_columns = [col + ' = ?' for col in set_columns]
-    where_columns = [col + ' = ?' for col in where_columns]
+    pairs = [(col, value) for col, value in zip(set_columns, values) if value is not None]
     query = 'UPDATE {} SET {} WHERE {}'.format(
         table,
-        ', '.join(set_columns),
-        ' AND '.join(where_columns)
+        ', '.join(f'{col} = ?' for col, _ in pairs),
+        ' AND '.join(f'{col} = ?' for col in where_columns)
     )
-    return query, values
+    return query, [value for _, value in pairs]
 
 
 def sql_filtered_insert(table, set_columns, values):
@@ -52,14 +49,10 @@ def sql_filtered_insert(table, set_columns, values):
     If the values are positioned incorrectly with respect to the column names,
     they will be saved in the wrong column!
     """
-    for index in range(len(set_columns) - 1, -1, -1):
-        if values[index] is None:
-            del set_columns[index]
-            del values[index]
-    values_fields = ['?'] * len(set_columns)
+    pairs = [(col, value) for col, value in zip(set_columns, values) if value is not None]
     query = 'INSERT INTO {} ({}) VALUES ({})'.format(
         table,
-        ', '.join(set_columns),
-        ', '.join(values_fields)
+        ', '.join(col for col, _ in pairs),
+        ', '.join(['?'] * len(pairs))
     )
-    return query, values
+    return query, [value for _, value in pairs]
@@ -17,6 +17,13 @@ from resources.lib.helpers.uuid_device import get_system_appcast_uuid
 
 
 class GlobalVariables:
+    # The instance attributes are fixed, '__slots__' makes every 'G.xxx' access a C-level
+    # slot load instead of a dict lookup and catches assignments to misspelled names
+    # (the class constants below cannot be listed here)
+    __slots__ = ('ADDON_ID', 'PLUGIN', 'ICON', 'ADDON', 'ADDON_DATA_PATH', 'DATA_PATH',
+                 'IS_SERVICE', 'SP_FRIENDLY_NAME', 'SP_MODEL_NAME', 'SP_MANUFACTURER_NAME',
+                 'DEVICE_UUID', 'sp_upnp_boot_id')
+
     DIAL_SERVER_PORT = 56789
     # SSDP_SERVER_PORT = 56790
     SSDP_BROADCAST_ADDR = '239.255.255.250'
@@ -55,11 +62,15 @@ class GlobalVariables:
             self.IS_SERVICE = True
         # Initialize the log
         from resources.lib.helpers.logging import LOG
+        # Read the debug flags in one pass and keep them local, to avoid repeating
+        # the Kodi settings API roundtrips on each argument
+        dbg_flags = {name: self.ADDON.getSettingBool(name)
+                     for name in ('enable_debug', 'debug_dial_server', 'debug_ssdp_server', 'debug_apps')}
         LOG.initialize(self.ADDON_ID,
-                       G.ADDON.getSettingBool('enable_debug'),
-                       G.ADDON.getSettingBool('debug_dial_server'),
-                       G.ADDON.getSettingBool('debug_ssdp_server'),
-                       G.ADDON.getSettingBool('debug_apps'))
+                       dbg_flags['enable_debug'],
+                       dbg_flags['debug_dial_server'],
+                       dbg_flags['debug_ssdp_server'],
+                       dbg_flags['debug_apps'])
         # Set SSDP server variables
         self.SP_FRIENDLY_NAME = xbmc.getInfoLabel("System.FriendlyName") or 'Kodi (AppCast)'
         self.SP_MODEL_NAME = 'MyDeviceModel'
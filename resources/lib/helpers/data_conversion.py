@@ -21,16 +21,9 @@ class DataTypeNotMapped(Exception):
 def convert_to_string(value):
     if value is None:
         return None
-    data_type = type(value)
-    if data_type == str:
-        return value
-    converter = None
-    if data_type in (int, float, bool, tuple, datetime.datetime):
-        converter = _conv_standard_to_string
-    if data_type in (list, dict, OrderedDict):
-        converter = _conv_json_to_string
+    converter = _CONV_TO_STRING.get(type(value))
     if not converter:
-        LOG.error('convert_to_string: Data type {} not mapped'.format(data_type))
+        LOG.error('convert_to_string: Data type {} not mapped'.format(type(value)))
         raise DataTypeNotMapped
     return converter(value)
 
@@ -38,15 +31,7 @@ def convert_to_string(value):
 def convert_from_string(value, to_data_type):
     if value is None:
         return None
-    if to_data_type in (str, int, float):
-        return to_data_type(value)
-    if to_data_type in (bool, list, tuple):
-        return literal_eval(value)
-    converter = None
-    if to_data_type == dict:
-        converter = _conv_string_to_json
-    if to_data_type == datetime.datetime:
-        converter = _conv_string_to_datetime
+    converter = _CONV_FROM_STRING.get(to_data_type)
     if not converter:
         LOG.error('convert_from_string: Data type {} not mapped'.format(to_data_type))
         raise DataTypeNotMapped
@@ -72,3 +57,28 @@ def _conv_string_to_datetime(value):
         # Python bug https://bugs.python.org/issue27400
         import time
         return datetime.datetime(*(time.strptime(value, '%Y-%m-%d %H:%M:%S.%f')[0:6]))
+
+
+# Dispatch tables (type -> converter) to avoid a chain of type checks on every call
+_CONV_TO_STRING = {
+    str: lambda value: value,
+    int: _conv_standard_to_string,
+    float: _conv_standard_to_string,
+    bool: _conv_standard_to_string,
+    tuple: _conv_standard_to_string,
+    datetime.datetime: _conv_standard_to_string,
+    list: _conv_json_to_string,
+    dict: _conv_json_to_string,
+    OrderedDict: _conv_json_to_string,
+}
+
+_CONV_FROM_STRING = {
+    str: str,
+    int: int,
+    float: float,
+    bool: literal_eval,
+    list: literal_eval,
+    tuple: literal_eval,
+    dict: _conv_string_to_json,
+    datetime.datetime: _conv_string_to_datetime,
+}
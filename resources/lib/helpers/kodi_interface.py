@@ -8,7 +8,10 @@
 """
 import json
 import threading
-from copy import deepcopy
+import time
+import traceback
+from collections import ChainMap, deque
+from types import MappingProxyType
 
 import xbmc
 
@@ -16,6 +19,31 @@ import resources.lib.helpers.kodi_ops as kodi_ops
 from resources.lib.globals import G
 from resources.lib.helpers.logging import LOG
 
+# Short TTL cache for xbmc.getCondVisibility, so bursts of reads within the same
+# event collapse to a single Python/C boundary crossing and condition parse
+_COND_CACHE_TTL_SECS = 0.05
+_cond_cache = {}  # Condition string -> (timestamp, value)
+
+# The Kodi event callbacks that a DIAL app can implement (see dial_app_test)
+CALLBACK_NAMES = ('on_playback_started', 'on_playback_paused', 'on_playback_resumed',
+                  'on_playback_seek', 'on_playback_stopped', 'on_playback_tick',
+                  'on_volume_changed', 'on_kodi_close')
+
+
+def init_callback_table(app):
+    """Resolve the Kodi event callbacks of an app once, at registration time"""
+    # Avoids a getattr MRO walk per notification
+    app._cb_table = {name: getattr(app, name, None) for name in CALLBACK_NAMES}
+
+
+def _get_cond_visibility(condition):
+    now = time.monotonic()
+    timestamp, value = _cond_cache.get(condition, (0, False))
+    if now - timestamp > _COND_CACHE_TTL_SECS:
+        value = xbmc.getCondVisibility(condition)
+        _cond_cache[condition] = (now, value)
+    return value
+
 
 class KodiInterface:
     """
@@ -23,11 +51,19 @@ class KodiInterface:
     """
     def __init__(self, apps):
         self._apps = apps
-        self._mutex = threading.Lock()
         # Todo: make event callbacks switchable when we change app with another app
         self._active_app = None
+        # Notification queue drained by the dispatcher thread, deque append/popleft
+        # are atomic so the Kodi event callbacks enqueue without taking a lock
+        self._queue = deque()
+        self._wake = threading.Event()
         self.player = Player(self)
         self.monitor = Monitor(self)
+        # Single scheduler thread reused for every playback, instead of one thread per video
+        self.playback_tick = PlaybackTickScheduler(self._notify_apps_bulk)
+        self.playback_tick.start()
+        self._dispatcher_thread = threading.Thread(target=self._dispatcher_loop, daemon=True)
+        self._dispatcher_thread.start()
 
     @property
     def active_app(self):
@@ -62,31 +98,57 @@ class KodiInterface:
         if self._active_app is None:
             LOG.warn('Ignored Kodi callback {}, no app currently active', callback_name)
             return False
-        self._mutex.acquire()
-        LOG.debug('Notify Kodi callback {} to {} with data: {}', callback_name, self._active_app.DIAL_APP_NAME, data)
-        ret = self._execute_notify(self._active_app, callback_name, data)
-        self._mutex.release()
-        return ret
+        self._queue.append((self._active_app, callback_name, data))
+        self._wake.set()
+        return True
+
+    def _notify_apps_bulk(self, callback_name, data=None):
+        """Notify a Kodi callback to all the registered apps with a single queue item"""
+        if not self._apps:
+            LOG.warn('Ignored Kodi callback {}, no app registered', callback_name)
+            return False
+        # One queued item carries the whole apps batch, the dispatcher fans it out,
+        # so the queue/wake traffic stays constant regardless of the apps count
+        self._queue.append((tuple(self._apps), callback_name, data))
+        self._wake.set()
+        return True
+
+    def _dispatcher_loop(self):
+        """Drain the notification queue and run the app callbacks (dispatcher thread)"""
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while self._queue:
+                target, callback_name, data = self._queue.popleft()
+                for app in target if isinstance(target, tuple) else (target,):
+                    LOG.debug('Notify Kodi callback {} to {} with data: {}', callback_name, app.DIAL_APP_NAME, data)
+                    self._execute_notify(app, callback_name, data)
 
     def _notify_all_apps(self, callback_name, data=None, extra_data_app=None):
+        # The base payload is shared read-only between all the apps (zero copies),
+        # the extra data is layered on top only for the app it belongs to
+        base_data = MappingProxyType(data or {})
         for _app in self._apps:
-            _data = deepcopy(data)
-            if extra_data_app[0] == self._active_app:
+            if extra_data_app and _app is extra_data_app[0]:
                 # If current app then send extra data only for this app
-                _data.update(extra_data_app[1])
+                _data = ChainMap(extra_data_app[1], base_data)
+            else:
+                _data = base_data
             LOG.debug('Notify Kodi callback {} to {} with data: {}', callback_name, _app.DIAL_APP_NAME, _data)
             self._execute_notify(_app, callback_name, _data)
 
     @staticmethod
     def _execute_notify(app, callback_name, data):
+        method = app._cb_table.get(callback_name)
+        if method is None:
+            # Callback not implemented by the app
+            return True
         try:
-            method = getattr(app, callback_name)
             method(data)
             return True
         except Exception:  # pylint: disable=broad-except
             LOG.error('The app {} has raised the following error on {} callback:',
                       app.DIAL_APP_NAME, callback_name)
-            import traceback
             LOG.error(traceback.format_exc())
             return False
 
@@ -128,7 +190,6 @@ class Player(xbmc.Player):
         self._is_tracking_enabled = False
         self._started_by_app = False
         self._init_count = 0
-        self._playback_tick = None
         super().__init__()
 
     def notify_video_started(self):
@@ -152,18 +213,15 @@ class Player(xbmc.Player):
         """Kodi is actually playing a media file (i.e stream is available)"""
         if not self._is_tracking_enabled:
             return
-        self._notify_apps('on_playback_started')
-        if (self._kodi_interface.active_app.CB_TICK_SECS is not None
-                and (self._playback_tick is None or not self._playback_tick.is_alive())):
-            self._playback_tick = PlaybackTick(self._kodi_interface._notify_apps,
-                                               self._kodi_interface.active_app.CB_TICK_SECS)
-            self._playback_tick.setDaemon(True)
-            self._playback_tick.start()
+        self._kodi_interface._notify_apps('on_playback_started')
+        if self._kodi_interface.active_app.CB_TICK_SECS is not None:
+            self._kodi_interface.playback_tick.start_tracking(self._kodi_interface.active_app.CB_TICK_SECS)
 
     def onPlayBackPaused(self):
         if not self._is_tracking_enabled:
             return
-        self._playback_tick.is_playback_paused = True
+        _cond_cache.clear()
+        self._kodi_interface.playback_tick.is_playback_paused = True
         self._kodi_interface._notify_apps('on_playback_paused')
 
     def onPlayBackResumed(self):
@@ -171,10 +229,11 @@ class Player(xbmc.Player):
             return
         # Kodi call this event instead the "Player.OnStop" event when you try to play a video
         # while another one is in playing
-        if not self._playback_tick.is_playback_paused:
+        if not self._kodi_interface.playback_tick.is_playback_paused:
             return
+        _cond_cache.clear()
         self._kodi_interface._notify_apps('on_playback_resumed')
-        self._playback_tick.is_playback_paused = False
+        self._kodi_interface.playback_tick.is_playback_paused = False
 
     def onPlayBackSeek(self, time, seek_offset):
         if not self._is_tracking_enabled:
@@ -202,12 +261,11 @@ class Player(xbmc.Player):
     def _on_stop(self, state):
         if not self._is_tracking_enabled:
             return
+        _cond_cache.clear()
         self._init_count -= 1
         if self._init_count == 0:  # If 0 means that no next video will be played from us
             self._is_tracking_enabled = False
-        if self._playback_tick and self._playback_tick.is_alive():
-            self._playback_tick.stop_join()
-            self._playback_tick = None
+        self._kodi_interface.playback_tick.stop_tracking()
         self._kodi_interface._notify_apps('on_playback_stopped', {'status': state})
 
     @property
@@ -215,11 +273,11 @@ class Player(xbmc.Player):
         """Whether the player is currently playing.
         This is different from `self.isPlaying()`
         in that it returns `False` if the player is paused or otherwise not actively playing."""
-        return xbmc.getCondVisibility('Player.Playing')
+        return _get_cond_visibility('Player.Playing')
 
     @property
     def is_paused(self):
-        return xbmc.getCondVisibility("Player.Paused")
+        return _get_cond_visibility('Player.Paused')
 
     @property
     def is_tracking_enabled(self):
@@ -240,23 +298,38 @@ class Monitor(xbmc.Monitor):
             self._kodi_interface._notify_all_apps('on_kodi_close', json.loads(data), extra_data_app)
 
 
-class PlaybackTick(threading.Thread):
-    """Thread to send a notification every (n) secs of playback"""
-    def __init__(self, notify_apps, timeout_secs):
+class PlaybackTickScheduler(threading.Thread):
+    """
+    Long-lived thread to send a notification every (n) secs of playback,
+    reused for every playback instead of creating/joining one thread per video
+    """
+    def __init__(self, notify_apps):
         self._notify_apps = notify_apps
-        self._timeout_secs = timeout_secs
-        self._stop_event = threading.Event()
+        self._timeout_secs = None
+        self._active = threading.Event()  # Set while a playback is tracked
+        self._wake = threading.Event()  # Interrupts the tick wait on stop
         self.is_playback_paused = False
-        super().__init__()
+        super().__init__(daemon=True)
 
     def run(self):
-        while not self._stop_event.is_set():
-            if not self._notify_apps('on_playback_tick', {'is_playback_paused': self.is_playback_paused}):
-                LOG.warn('PlaybackTick: Interrupted due to an error')
-                break
-            if self._stop_event.wait(self._timeout_secs):
-                break  # Stop requested by stop_join
-
-    def stop_join(self):
-        self._stop_event.set()
-        self.join()
+        while True:
+            self._active.wait()
+            while self._active.is_set():
+                if not self._notify_apps('on_playback_tick', {'is_playback_paused': self.is_playback_paused}):
+                    LOG.warn('PlaybackTick: Interrupted due to an error')
+                    self._active.clear()
+                    break
+                self._wake.wait(self._timeout_secs)
+                self._wake.clear()
+
+    def start_tracking(self, timeout_secs):
+        """Begin sending the periodic 'on_playback_tick' notifications"""
+        self._timeout_secs = timeout_secs
+        self.is_playback_paused = False
+        self._wake.clear()
+        self._active.set()
+
+    def stop_tracking(self):
+        """Stop sending the periodic notifications (the thread stays parked for the next playback)"""
+        self._active.clear()
+        self._wake.set()
@@ -7,11 +7,30 @@
     See LICENSES/MIT.md for more information.
 """
 import json
+import time
 
 import xbmc
 
 from resources.lib.globals import G
 
+# Prefer a C-implemented JSON codec when one is available in the Kodi Python
+# environment, the stdlib module remains the fallback
+try:
+    import orjson
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode('ascii')
+    _json_loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        _json_dumps = ujson.dumps
+        _json_loads = ujson.loads
+    except ImportError:
+        _json_dumps = json.dumps
+        _json_loads = json.loads
+
+_RPC_EMPTY_PARAMS = {}
+
 
 def json_rpc(method, params=None):
     """
@@ -24,12 +43,16 @@ def json_rpc(method, params=None):
     :returns: dict -- Method call result
     """
     request_data = {'jsonrpc': '2.0', 'method': method, 'id': 1,
-                    'params': params or {}}
-    request = json.dumps(request_data)
+                    'params': params or _RPC_EMPTY_PARAMS}
+    request = _json_dumps(request_data)
     # LOG.debug('Executing JSON-RPC: {}', request)
+    # NOTE: xbmc.executeJSONRPC blocks until Kodi has processed the RPC, whether the
+    # GIL is released while it waits depends on the Kodi python binding and cannot be
+    # influenced from here; keep this in mind before calling it from latency-sensitive
+    # paths (e.g. inside the DIAL request handling)
     raw_response = xbmc.executeJSONRPC(request)
     # LOG.debug('JSON-RPC response: {}', raw_response)
-    response = json.loads(raw_response)
+    response = _json_loads(raw_response)
     if 'error' in response:
         raise IOError('JSONRPC-Error {}: {}'
                       .format(response['error']['code'],
@@ -48,8 +71,18 @@ def show_notification(msg, title='AppCast', time=3000):
     xbmc.executebuiltin('Notification({}, {}, {}, {})'.format(title, msg, time, G.ICON))
 
 
+# TTL cache for the local IP: [timestamp, ip]. The address changes rarely on a
+# DIAL device, the request paths only pay a monotonic-clock read + comparison
+_LOCAL_IP_TTL_SECS = 30.0
+_local_ip_cache = [0.0, None]
+
+
 def get_local_ip():
-    return xbmc.getIPAddress()
+    now = time.monotonic()
+    if now - _local_ip_cache[0] > _LOCAL_IP_TTL_SECS:
+        _local_ip_cache[1] = xbmc.getIPAddress()
+        _local_ip_cache[0] = now
+    return _local_ip_cache[1]
 
 
 def is_addon_enabled(addon_id):
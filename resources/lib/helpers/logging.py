@@ -6,6 +6,8 @@
     SPDX-License-Identifier: MIT
     See LICENSES/MIT.md for more information.
 """
+import sys
+
 import xbmc
 
 
@@ -16,7 +18,7 @@ class Logging:
     TYPE_APPS = 'debug_apps'
 
     def __init__(self):
-        self.__addon_id = None
+        self._prefix = '[] '
         self.is_enabled = False
         self.debug_dial_server = False
         self.debug_ssdp_server = False
@@ -24,9 +26,11 @@ class Logging:
         self.debug = self._debug
         self.info = self._info
         self.warn = self._warn
+        self._sub_loggers = []
 
     def initialize(self, addon_id, is_enabled, debug_dial_server, debug_ssdp_server, debug_apps):
-        self.__addon_id = addon_id
+        # The add-on id never changes at runtime, build the message prefix once
+        self._prefix = '[{}] '.format(addon_id)
         self.is_enabled = is_enabled
         self.debug_dial_server = debug_dial_server and is_enabled
         self.debug_ssdp_server = debug_ssdp_server and is_enabled
@@ -38,15 +42,31 @@ class Logging:
             self.debug = self.__not_to_process
             self.info = self.__not_to_process
             self.warn = self.__not_to_process
+        # Rebind the sub-loggers methods now that the debug flags are known
+        for sub_logger in self._sub_loggers:
+            sub_logger.bind_methods()
+        self._setup_free_threading()
+
+    def _setup_free_threading(self):
+        """On free-threaded builds, mark the bound log methods for deferred reference
+        counting so concurrent reads from many threads do not contend on the refcounts.
+        No-op on regular (GIL) builds and on builds without the hook."""
+        is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+        defer_refcount = getattr(sys, '_defer_refcount', None)
+        if not defer_refcount or not is_gil_enabled or is_gil_enabled():
+            return
+        for method in (self.debug, self.info, self.warn, self.error):
+            defer_refcount(method)
+
+    def register_sub_logger(self, sub_logger):
+        """Keep track of a GetLogger instance, to rebind its log methods on (re)initialize"""
+        self._sub_loggers.append(sub_logger)
 
     def __log(self, msg, log_level, *args, **kwargs):
         """Log a message to the Kodi logfile."""
         if args or kwargs:
             msg = msg.format(*args, **kwargs)
-        message = '[{identifier}] {msg}'.format(
-            identifier=self.__addon_id,
-            msg=msg)
-        xbmc.log(message, log_level)
+        xbmc.log(self._prefix + msg, log_level)
 
     def _debug(self, msg, *args, **kwargs):
         """Log a debug message."""
@@ -73,29 +93,35 @@ class GetLogger:
     def __init__(self, name, debug_type):
         self.name = '{}: '.format(name)
         self.debug_type = debug_type
-        self.debug = self._debug
-        self.info = self._info
-        self.warn = self._warn
+        self.bind_methods()
+        LOG.register_sub_logger(self)
+
+    def bind_methods(self):
+        """Resolve the debug flag once and bind the log methods accordingly"""
+        # Binding here avoids a 'getattr' flag check and a prefix concatenation
+        # on every log call (the concatenation is skipped entirely when disabled)
+        # The flag is public so hot paths can skip even the no-op call and the
+        # evaluation of expensive log arguments
+        self.is_debug_enabled = getattr(LOG, self.debug_type)
+        if self.is_debug_enabled:
+            self.debug = self._debug
+            self.info = self._info
+            self.warn = self._warn
+        else:
+            self.debug = self.__not_to_process
+            self.info = self.__not_to_process
+            self.warn = self.__not_to_process
 
     def _debug(self, msg, *args, **kwargs):
         """Log a debug message."""
-        if not getattr(LOG, self.debug_type):
-            self.debug = self.__not_to_process
-            return
         LOG.debug(self.name + msg, *args, **kwargs)
 
     def _info(self, msg, *args, **kwargs):
         """Log an info message."""
-        if not getattr(LOG, self.debug_type):
-            self.info = self.__not_to_process
-            return
         LOG.info(self.name + msg, *args, **kwargs)
 
     def _warn(self, msg, *args, **kwargs):
         """Log a warning message."""
-        if not getattr(LOG, self.debug_type):
-            self.warn = self.__not_to_process
-            return
         LOG.warn(self.name + msg, *args, **kwargs)
 
     def error(self, msg, *args, **kwargs):
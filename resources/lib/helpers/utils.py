@@ -6,7 +6,8 @@
     SPDX-License-Identifier: MIT
     See LICENSES/MIT.md for more information.
 """
-from functools import wraps
+import traceback
+from functools import lru_cache, wraps
 from urllib.parse import unquote
 from xml.sax.saxutils import escape
 
@@ -20,6 +21,8 @@ IPC_TIMEOUT_SECS = 20
 IPC_EXCEPTION_PLACEHOLDER = 'IPC_EXCEPTION_PLACEHOLDER'
 IPC_ADDON_ID = xbmcaddon.Addon().getAddonInfo('id')
 
+_SENTINEL = object()  # Marker to distinguish 'key missing' from any real value
+
 
 def url_decode_xml_encode(string_value):
     """URL-unescape the string, then XML-escape it"""
@@ -28,13 +31,19 @@ def url_decode_xml_encode(string_value):
 
 def get_string_size(string_value):
     """Return the byte size of a string (encoded with utf-8)"""
+    # For ASCII strings (the common case here) the length equals the byte size,
+    # isascii() is a cheap C-level check that skips the encode entirely
+    if string_value.isascii():
+        return len(string_value)
     return len(string_value.encode('utf-8'))
 
 
 def fix_return_chars(string_value):
     """Replace existing return chars with return chars for HTTP"""
     # This is needed because some apps not parse the message correctly
-    return '\r\n'.join(string_value.splitlines())
+    # Normalize any CRLF/CR to LF first, then expand every LF to CRLF:
+    # three C-level str.replace scans, no line list allocation
+    return string_value.replace('\r\n', '\n').replace('\r', '\n').replace('\n', '\r\n')
 
 
 class FormatMapSubCls(dict):
@@ -45,16 +54,20 @@ class FormatMapSubCls(dict):
 
 def is_ascii(byte_string):
     """Check if a byte string is ascii"""
-    try:
-        byte_string.decode('ascii')
-    except UnicodeEncodeError:
-        return False
-    return True
+    # bytes.isascii() is a C-level scan, no decode attempt and no exception handling
+    # (the old decode also caught the wrong exception, decode raises UnicodeDecodeError)
+    return byte_string.isascii()
+
+
+@lru_cache(maxsize=256)
+def _parse_version(version):
+    """Parse a dotted version string in to a comparable tuple (memoized)"""
+    return tuple(map(int, version.split('.')))
 
 
 def is_less_version(version, max_version):
     """Return True if version is less to max_version"""
-    return list(map(int, version.split('.'))) < list(map(int, max_version.split('.')))
+    return _parse_version(version) < _parse_version(max_version)
 
 
 def register_addonsignals_slot(callback, signal=None, source_id=None):
@@ -94,11 +107,15 @@ def make_addonsignals_call(callname, data=None):
 
 def _raise_for_error(result):
     # The json exception data format is set by ipc_convert_exc_to_json function
-    if isinstance(result, dict) and IPC_EXCEPTION_PLACEHOLDER in result:
-        result = result[IPC_EXCEPTION_PLACEHOLDER]
-        if result['class'] in exceptions.__dict__:
-            raise exceptions.__dict__[result['class']](result['message'])
-        raise Exception(result['class'] + '\r\nError details:\r\n' + result.get('message', '--'))
+    if not isinstance(result, dict):
+        return
+    # A single dict.get with sentinel instead of a membership test + item lookup
+    exc_data = result.get(IPC_EXCEPTION_PLACEHOLDER, _SENTINEL)
+    if exc_data is not _SENTINEL:
+        exc_class = exceptions.__dict__.get(exc_data['class'])
+        if exc_class:
+            raise exc_class(exc_data['message'])
+        raise Exception(exc_data['class'] + '\r\nError details:\r\n' + exc_data.get('message', '--'))
 
 
 def ipc_return_call_decorator(func):
@@ -117,7 +134,6 @@ def _perform_ipc_return_call_instance(instance, func, data):
         result = _call_with_instance(instance, func, data)
     except Exception as exc:  # pylint: disable=broad-except
         LOG.error('IPC callback raised exception: {exc}', exc=exc)
-        import traceback
         LOG.error(traceback.format_exc())
         result = ipc_convert_exc_to_json(exc)
     AddonSignals.returnCall(signal=func.__name__, source_id=IPC_ADDON_ID, data=result)
@@ -6,7 +6,10 @@
     SPDX-License-Identifier: MIT
     See LICENSES/MIT.md for more information.
 """
-import threading
+import selectors
+import socket
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import xbmc
 
@@ -18,61 +21,96 @@ from resources.lib.helpers.logging import LOG
 
 class AppCastService:
     HOST_ADDRESS = '0.0.0.0'
+    DB_OPTIMIZE_INTERVAL_SECS = 900  # Cadence of the periodic SQLite maintenance
 
     def __init__(self):
         self.dial_srv_instance = None
-        self.dial_srv_thread = None
         self.ssdp_udp_srv_instance = None
-        self.ssdp_udp_srv_thread = None
+        self._selector = None
+        self._executor = None
+        self._wake_sockets = None
 
     def init_servers(self):
         """Initialize the servers"""
         try:
             self.dial_srv_instance = dial_server.DialTCPServer((self.HOST_ADDRESS, G.DIAL_SERVER_PORT))
             self.dial_srv_instance.allow_reuse_address = True
-            self.dial_srv_thread = threading.Thread(target=self.dial_srv_instance.serve_forever)
             self.ssdp_udp_srv_instance = ssdp_server.SSDPUDPServer()
             self.ssdp_udp_srv_instance.allow_reuse_address = True
-            self.ssdp_udp_srv_thread = threading.Thread(target=self.ssdp_udp_srv_instance.serve_forever)
             return True
         except Exception:  # pylint: disable=broad-except
-            import traceback
             LOG.error(traceback.format_exc())
         return False
 
     def start_services(self):
-        """Start the background services"""
+        """Register the server sockets on the shared reactor"""
+        # Both servers are served by one selectors reactor instead of one
+        # blocking serve_forever thread each: on the single-core devices the
+        # extra threads give no throughput and only add context-switch cost
         self.dial_srv_instance.server_activate()
-        self.dial_srv_thread.start()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.dial_srv_instance, selectors.EVENT_READ)
         LOG.info('[DialServer] service started')
-        self.ssdp_udp_srv_thread.start()
+        self._selector.register(self.ssdp_udp_srv_instance, selectors.EVENT_READ)
         LOG.info('[SSDPUDPServer] service started')
+        # Self-pipe to wake the reactor out of its unbounded select on shutdown
+        self._wake_sockets = socket.socketpair()
+        self._selector.register(self._wake_sockets[0], selectors.EVENT_READ)
+        # The executor owns the reactor thread, its shutdown(wait=True) replaces
+        # the manual thread/join bookkeeping (and allows more workers if more
+        # servers are added in the future)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='appcast')
+        self._executor.submit(self._reactor_loop)
+
+    def _reactor_loop(self):
+        """Dispatch the readable server sockets (reactor thread)"""
+        try:
+            while True:
+                for key, _ in self._selector.select():
+                    if key.fileobj is self._wake_sockets[0]:
+                        return
+                    key.fileobj._handle_request_noblock()  # pylint: disable=protected-access
+        except Exception:  # pylint: disable=broad-except
+            LOG.error(traceback.format_exc())
 
     def shutdown(self):
         """Stop the background services"""
-        self.dial_srv_instance.shutdown()
+        self._wake_sockets[1].send(b'\x00')
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._selector.unregister(self.dial_srv_instance)
         self.dial_srv_instance.server_close()
         self.dial_srv_instance = None
-        self.dial_srv_thread.join()
-        self.dial_srv_thread = None
         LOG.info('[DialServer] service stopped')
-        self.ssdp_udp_srv_instance.shutdown()
+        self._selector.unregister(self.ssdp_udp_srv_instance)
         self.ssdp_udp_srv_instance.server_close()
         self.ssdp_udp_srv_instance = None
-        self.ssdp_udp_srv_thread.join()
-        self.ssdp_udp_srv_thread = None
         LOG.info('[SSDPUPDServer] service stopped')
+        self._selector.unregister(self._wake_sockets[0])
+        self._selector.close()
+        self._selector = None
+        self._wake_sockets[0].close()
+        self._wake_sockets[1].close()
+        self._wake_sockets = None
+
+    def _optimize_databases(self):
+        """Run the periodic SQLite maintenance on the databases of the registered DIAL apps"""
+        for app in dial_server.APPS:
+            if app.db:
+                app.db.optimize()
 
     def run(self):
         """Main loop. Runs until xbmc.Monitor requests abort"""
         try:
             self.start_services()
             monitor = xbmc.Monitor()
-            while not monitor.abortRequested():
-                monitor.waitForAbort(1)
+            # waitForAbort is the only blocker here: no fixed polling wakeups, Kodi
+            # signals its internal event on abort and the wait returns immediately;
+            # the timeout doubles as the periodic database maintenance cadence
+            while not monitor.waitForAbort(self.DB_OPTIMIZE_INTERVAL_SECS):
+                self._optimize_databases()
             self.shutdown()
         except Exception:  # pylint: disable=broad-except
-            import traceback
             LOG.error(traceback.format_exc())
 
 
@@ -11,54 +11,69 @@ import json
 
 import resources.lib.helpers.file_ops as fileops
 
-OPTIONS_RESPONSE = '''\
+# The response templates are pre-encoded to bytes at import time with '__KEY__'
+# placeholder tokens, filled at send time by 'fill' (a few bytes.replace calls),
+# so no str allocation, format parsing or UTF-8 encode happens per response
+OPTIONS_RESPONSE = b'''\
 HTTP/1.1 204 No Content\r
-Access-Control-Allow-Methods: {methods}\r
+Access-Control-Allow-Methods: __METHODS__\r
 Access-Control-Max-Age: 86400\r
-Access-Control-Allow-Origin: {origin}\r
+Access-Control-Allow-Origin: __ORIGIN__\r
 Content-Length: 0\r
 \r
 '''
 
-STOP_RESPONSE = '''\
+STOP_RESPONSE = b'''\
 HTTP/1.1 200 OK\r
 Content-Type: text/plain\r
-Access-Control-Allow-Origin: {origin}\r
+Access-Control-Allow-Origin: __ORIGIN__\r
 \r
 '''
 
-CREATED_RESPONSE = '''\
+CREATED_RESPONSE = b'''\
 HTTP/1.1 201 Created\r
 Content-Type: text/plain\r
-Location: http://{address}:{dial_port}/apps/{app_name}/run\r
-Access-Control-Allow-Origin: {origin}\r
+Location: http://__ADDRESS__:__DIAL_PORT__/apps/__APP_NAME__/run\r
+Access-Control-Allow-Origin: __ORIGIN__\r
 \r
 '''
 
-STATUS_RESPONSE = '''\
+# The status response is polled every 1-2 seconds by the clients, it uses
+# printf-style %b fields (origin, dial version, app name, allowStop, state,
+# link, additionalData) which skip even the token-replacement scans of 'fill'
+STATUS_RESPONSE = b'''\
 HTTP/1.1 200 OK\r
 Content-Type: text/xml\r
-Access-Control-Allow-Origin: {origin}\r
+Access-Control-Allow-Origin: %b\r
 \r
 <?xml version="1.0" encoding="UTF-8"?>\r
-<service xmlns="urn:dial-multiscreen-org:schemas:dial" dialVer="{dial_version}">\r
-  <name>{app_name}</name>\r
-  <options allowStop="{can_stop}"/>\r
-  <state>{dial_state}</state>\
-{link}\r
-  <additionalData>{dial_data}</additionalData>\r
+<service xmlns="urn:dial-multiscreen-org:schemas:dial" dialVer="%b">\r
+  <name>%b</name>\r
+  <options allowStop="%b"/>\r
+  <state>%b</state>\
+%b\r
+  <additionalData>%b</additionalData>\r
 </service>\r
 \r
 '''
 
-RESPONSE_OK = '''\
+RESPONSE_OK = b'''\
 HTTP/1.1 200 OK\r
 Content-Type: text/plain\r
-Access-Control-Allow-Origin: {origin}\r
+Access-Control-Allow-Origin: __ORIGIN__\r
 \r
 '''
 
 
+def fill(template, **kwargs):
+    """Fill a pre-encoded byte response template by replacing the '__KEY__' tokens"""
+    for key, value in kwargs.items():
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8') if isinstance(value, str) else str(value).encode('utf-8')
+        template = template.replace(b'__' + key.upper().encode('ascii') + b'__', value)
+    return template
+
+
 class DialStatus:  # Copy on helpers/utils.py
     STOPPED = 0
     HIDE = 1
@@ -74,7 +89,9 @@ def store_dial_data(app_name, data):
     # NOTE: the reference code store the file in the application folder, we save the file in our data folder
     #   perhaps other changes will be needed to allow USE_ADDITIONAL_DATA feature to work
     file_path = 'dial_data/' + app_name + '.json'
-    fileops.save_file_def(file_path, json.dumps(data).encode('utf-8'))
+    # json.dumps escapes any non-ASCII char by default (ensure_ascii=True),
+    # so the cheaper plain ASCII encode is always valid here
+    fileops.save_file_def(file_path, json.dumps(data).encode('ascii'))
 
 
 def retrieve_dial_data(app_name):
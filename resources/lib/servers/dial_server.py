@@ -10,12 +10,15 @@
 import importlib
 import importlib.machinery
 import importlib.util
+import os.path
 import re
 import sys
-from copy import deepcopy
+import traceback
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler
-from socketserver import TCPServer
-from threading import Lock
+from socketserver import TCPServer, ThreadingMixIn
+from threading import RLock
 from typing import TYPE_CHECKING, Type
 from urllib.parse import parse_qs, urlparse
 
@@ -26,17 +29,22 @@ import resources.lib.helpers.utils as utils
 import resources.lib.servers.ssdp_helper as ssdp_msgs
 from resources.lib.globals import G
 from resources.lib.helpers import kodi_ops, file_ops
-from resources.lib.helpers.kodi_interface import KodiInterface
+from resources.lib.helpers.kodi_interface import KodiInterface, init_callback_table
 from resources.lib.helpers.logging import GetLogger, LOG
 from resources.lib.servers.dial_helper import (OPTIONS_RESPONSE, STATUS_RESPONSE, CREATED_RESPONSE, STOP_RESPONSE,
-                                               DialStatus, RESPONSE_OK, store_dial_data, retrieve_dial_data)
+                                               DialStatus, RESPONSE_OK, fill, store_dial_data, retrieve_dial_data)
 
 if TYPE_CHECKING:  # This variable/import is used only by the editor, so not at runtime
     from resources.lib.apps.dial_app_test.dial_app_test import DialApp
 
 LOGGER = GetLogger('DIAL-Server', LOG.TYPE_DIAL_SERVER)
 
-MUTEX = Lock()
+# Guards the APPS list (registration and lookups). Handlers acquire it with a
+# short timeout: under contention a client gets some latency instead of an
+# immediate 500, and the critical sections are kept to the bare APPS access
+# (never around the app callbacks, which run user code)
+APPS_LOCK = RLock()
+LOCK_TIMEOUT_SECS = 0.25
 
 DIAL_VERSION = '2.2'  # DIAL version that is reported via in the status response
 DIAL_MAX_PAYLOAD = 4096  # The maximum DIAL payload accepted per the DIAL 1.6.1 specification
@@ -50,12 +58,35 @@ HIDE_URI = '/hide'
 DIAL_DATA_URI = '/dial_data'
 
 APPS = []  # List of classes instances of the currently registered DIAL apps/Kodi add-ons
+APPS_BY_NAME = {}  # Same instances of APPS, keyed by DIAL app name for O(1) lookup
+_MODULE_CACHE = {}  # Loaded external DIAL app modules: addon id -> (module path, mtime, module)
 
 
-class DialTCPServer(TCPServer):
+def _split_qs(query):
+    """Parse a simple query string in to a flat dict (each value is a single string)"""
+    # The DIAL query strings are trivial ('clientDialVer=2.1'), a plain split
+    # avoids the regex machinery of parse_qs; parse_qs remains in use for the
+    # real dial_data payloads, which need unquoting and repeated keys
+    if not query:
+        return {}
+    params = {}
+    for pair in query.split('&'):
+        key, _, value = pair.partition('=')
+        params[key] = value
+    return params
+
+
+class DialTCPServer(ThreadingMixIn, TCPServer):
     """Override TCPServer to allow usage of shared members"""
+    # Bound of the request worker pool: the workload is I/O-bound (status polls,
+    # app callbacks), a small fixed pool gives concurrency to the DIAL clients
+    # without the unbounded thread spawning of plain ThreadingMixIn
+    MAX_WORKERS = 8
+    daemon_threads = True
+
     def __init__(self, server_address):
         """Initialization of DialTCPServer"""
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='dial-worker')
         kodi_interface = KodiInterface(APPS)
         if G.ADDON.getSettingBool('use_internal_apps'):
             LOGGER.info('Registering internal DIAL apps/add-ons')
@@ -71,54 +102,46 @@ class DialTCPServer(TCPServer):
         self.timeout = 1
         super().__init__(server_address, DSHttpRequestHandler)
 
+    def process_request(self, request, client_address):
+        """Hand the request over to the worker pool instead of spawning a thread"""
+        self._executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
 
 class DSHttpRequestHandler(BaseHTTPRequestHandler):
     """Handles requests from HTTP"""
     # pylint: disable=invalid-name
-    def __init__(self, request, client_address, server):
-        super().__init__(request, client_address, server)
-        self.query_params = None
-        self.body_data_size = 0
-        self.body_data = b''
-
-    def do_POST(self):
-        self.route()
-
-    def do_GET(self):
-        self.route()
-
-    def do_OPTIONS(self):
-        self.route()
-
-    def do_DELETE(self):
-        self.route()
-
     def route(self):
         LOGGER.debug('Received {} request {} {}', self.command, self.path, self.client_address)
         parsed_url = urlparse(self.path)
+        self.parsed_url = parsed_url  # Parsed once here, reused by the handlers
         if parsed_url.path == '/ssdp/device-desc.xml':
             handle_dd(self)
         else:
-            self.query_params = parse_qs(parsed_url.query)  # NOTICE: the values of each query_params are always lists!
+            self.query_params = _split_qs(parsed_url.query)  # NOTICE: each value is a single string
             # Get body content
             self.body_data_size = int(self.headers.get('content-length', 0))
             if self.body_data_size:
                 self.body_data = self.rfile.read(self.body_data_size) or b''
             else:
                 self.body_data = b''
-            origin_header = self.headers.get('Origin', self.headers.get('origin'))
-            host_header = self.headers.get('Host', self.headers.get('host'))
+            # HTTPMessage lookups are case-insensitive, one probe is enough
+            origin_header = self.headers.get('Origin')
+            host_header = self.headers.get('Host')
             try:
                 handle_request(self, self.command, parsed_url.path, origin_header, host_header)
             except Exception as exc:
                 LOGGER.error('handle_request raised an exception: {}', exc)
-                import traceback
                 LOGGER.error(traceback.format_exc())
                 self.call_error(500, 'ERROR')
 
     def call_response(self, data):
+        """Send a response (pre-encoded bytes)"""
         LOGGER.debug('Send response:\n{}', data)
-        self.wfile.write(data.encode('utf-8'))
+        self.wfile.write(data)
 
     def call_error(self, code, message):
         LOGGER.debug('Send error response: ({}) {}', code, message)
@@ -128,121 +151,149 @@ class DSHttpRequestHandler(BaseHTTPRequestHandler):
     def log_message(self, *args):  # pylint: disable=arguments-differ
         """Override method to disable the BaseHTTPServer Log"""
 
+    # All the supported HTTP methods go through the same router, class-level
+    # aliases avoid a wrapper frame per dispatch
+    do_POST = do_GET = do_OPTIONS = do_DELETE = route
+
+
+# Cached device descriptor response: [local ip it was built for, response bytes];
+# everything else in the XML is constant for the process lifetime
+_DD_XML_CACHE = [None, b'']
+
 
 def handle_dd(server):
     """Handle SSDP HTTP request for device descriptor xml"""
-    data = ssdp_msgs.DD_XML.format(
-        ip_addr=kodi_ops.get_local_ip(),
-        dial_port=G.DIAL_SERVER_PORT,
-        friendly_name=G.SP_FRIENDLY_NAME,
-        manufacturer_name=G.SP_MANUFACTURER_NAME,
-        model_name=G.SP_MODEL_NAME,
-        device_uuid=G.DEVICE_UUID
-    )
-    server.call_response(utils.fix_return_chars(data))
+    ip_addr = kodi_ops.get_local_ip()
+    if _DD_XML_CACHE[0] != ip_addr:
+        data = ssdp_msgs.DD_XML.format(
+            ip_addr=ip_addr,
+            dial_port=G.DIAL_SERVER_PORT,
+            friendly_name=G.SP_FRIENDLY_NAME,
+            manufacturer_name=G.SP_MANUFACTURER_NAME,
+            model_name=G.SP_MODEL_NAME,
+            device_uuid=G.DEVICE_UUID
+        )
+        _DD_XML_CACHE[1] = utils.fix_return_chars(data).encode('utf-8')
+        _DD_XML_CACHE[0] = ip_addr
+    server.call_response(_DD_XML_CACHE[1])
 
 
 def handle_request(server, req_method, req_path, origin_header, host_header):
-    if req_path.endswith(RUN_URI):
-        # URL ends with run
-        # Maximum app name length of 255 characters.
-        app_name = req_path.split('/')[-2][:255]
-        # Check authorized origins.
-        if origin_header and not is_allowed_origin(origin_header, app_name):
-            server.call_error(403, 'Forbidden')
-            return
-        # Return OPTIONS.
-        if req_method == 'OPTIONS':
-            server.call_response(OPTIONS_RESPONSE.format(origin=origin_header, methods='DELETE, OPTIONS'))
-            return
-        # DELETE non-empty app name
-        if app_name and req_method == 'DELETE':
-            handle_app_stop(server, app_name, origin_header)
-        else:
-            server.call_error(501, 'Not Implemented')
+    # O(1) dispatch on the last URI component, the generic "/apps/{name}" form
+    # (status/start) is the fallback. Only the last two components are ever
+    # needed, the bounded rsplit allocates at most three pieces
+    parts = req_path.strip('/').rsplit('/', 2)
+    handler = _URI_DISPATCH.get(parts[-1])
+    if handler:
+        handler(server, req_method, parts, origin_header)
     elif req_path.startswith(APPS_URI):
-        # URI starts with "/apps/" and is followed by an app name
-        app_name = req_path.replace(APPS_URI, '')
-        # Check authorized origins.
-        if origin_header and not is_allowed_origin(origin_header, app_name):
-            server.call_error(403, 'Forbidden')
-            return
-        # Return OPTIONS.
-        if req_method == 'OPTIONS':
-            server.call_response(OPTIONS_RESPONSE.format(origin=origin_header, methods='GET, POST, OPTIONS'))
-            return
-        # Start app
-        if req_method == 'POST':
-            handle_app_start(server, app_name, origin_header)
-        # Get app status
-        elif req_method == 'GET':
-            handle_app_status(server, app_name, origin_header)
-        else:
-            server.call_error(501, 'Not Implemented')
-    elif req_path.endswith(HIDE_URI):
-        # URI that ends with HIDE_URI
-        # Maximum app name length of 255 characters.
-        app_name = req_path.split('/')[-2][:255]
-        # Check authorized origins.
-        if origin_header and not is_allowed_origin(origin_header, app_name):
-            server.call_error(403, 'Forbidden')
-            return
-        if req_method == 'OPTIONS':
-            server.call_response(OPTIONS_RESPONSE.format(origin=origin_header, methods='POST, OPTIONS'))
-            return
-        # Hide app
-        if app_name and req_method == 'POST':
-            handle_app_hide(server, app_name, origin_header)
-        else:
-            server.call_error(501, 'Not Implemented')
-    elif req_path.endswith(DIAL_DATA_URI):
-        # URI is of the form */app_name/dial_data
-        # Check if the call come from localhost
-        if server.client_address[0] in ['127.0.0.1', xbmc.getIPAddress()]:
-            app_name = req_path.split('/')[-2]
-            if not app_name:
-                server.call_error(500, '500 Internal Server Error')
-            else:
-                # Check authorized origins.
-                if origin_header and not is_allowed_origin(origin_header, app_name):
-                    server.call_error(403, 'Forbidden')
-                    return
-                if req_method == 'OPTIONS':
-                    server.call_response(OPTIONS_RESPONSE.format(origin=origin_header, methods='POST, OPTIONS'))
-                    return
-                # Deliver data payload
-                handle_dial_data(server, app_name, origin_header, req_method == 'POST')
-        else:
-            server.call_error(404, 'Not found')
+        _handle_apps_uri(server, req_method, req_path, origin_header)
+
+
+def _check_origin_and_options(server, req_method, app_name, origin_header, methods):
+    """Shared authorized-origin check and OPTIONS preflight answer.
+    Return True when the request has already been answered."""
+    if origin_header and not is_allowed_origin(origin_header, app_name):
+        server.call_error(403, 'Forbidden')
+        return True
+    if req_method == 'OPTIONS':
+        server.call_response(fill(OPTIONS_RESPONSE, origin=origin_header, methods=methods))
+        return True
+    return False
+
+
+def _handle_run_uri(server, req_method, parts, origin_header):
+    # URI ends with "/run"
+    # Maximum app name length of 255 characters.
+    app_name = parts[-2][:255] if len(parts) > 1 else ''
+    if _check_origin_and_options(server, req_method, app_name, origin_header, 'DELETE, OPTIONS'):
+        return
+    # DELETE non-empty app name
+    if app_name and req_method == 'DELETE':
+        handle_app_stop(server, app_name, origin_header)
+    else:
+        server.call_error(501, 'Not Implemented')
+
+
+def _handle_hide_uri(server, req_method, parts, origin_header):
+    # URI ends with "/hide"
+    # Maximum app name length of 255 characters.
+    app_name = parts[-2][:255] if len(parts) > 1 else ''
+    if _check_origin_and_options(server, req_method, app_name, origin_header, 'POST, OPTIONS'):
+        return
+    # Hide app
+    if app_name and req_method == 'POST':
+        handle_app_hide(server, app_name, origin_header)
+    else:
+        server.call_error(501, 'Not Implemented')
+
+
+def _handle_dial_data_uri(server, req_method, parts, origin_header):
+    # URI is of the form */app_name/dial_data
+    # Check if the call come from localhost
+    if server.client_address[0] not in ['127.0.0.1', xbmc.getIPAddress()]:
+        server.call_error(404, 'Not found')
+        return
+    app_name = parts[-2] if len(parts) > 1 else ''
+    if not app_name:
+        server.call_error(500, '500 Internal Server Error')
+        return
+    if _check_origin_and_options(server, req_method, app_name, origin_header, 'POST, OPTIONS'):
+        return
+    # Deliver data payload
+    handle_dial_data(server, app_name, origin_header, req_method == 'POST')
+
+
+def _handle_apps_uri(server, req_method, req_path, origin_header):
+    # URI starts with "/apps/" and is followed by an app name
+    app_name = req_path[len(APPS_URI):]
+    if _check_origin_and_options(server, req_method, app_name, origin_header, 'GET, POST, OPTIONS'):
+        return
+    # Start app
+    if req_method == 'POST':
+        handle_app_start(server, app_name, origin_header)
+    # Get app status
+    elif req_method == 'GET':
+        handle_app_status(server, app_name, origin_header)
+    else:
+        server.call_error(501, 'Not Implemented')
+
+
+_URI_DISPATCH = {
+    'run': _handle_run_uri,
+    'hide': _handle_hide_uri,
+    'dial_data': _handle_dial_data_uri,
+}
 
 
 def handle_app_status(server, app_name, origin_header):
     # Determine client version
-    client_version = float(server.query_params.get('clientDialVer', ['0.0'])[0])
-    if not MUTEX.acquire(False):
+    client_version = float(server.query_params.get('clientDialVer', '0.0'))
+    if not APPS_LOCK.acquire(timeout=LOCK_TIMEOUT_SECS):
         server.call_error(500, '500 Internal Server Error')
         return
-    app = find_app(app_name)
+    try:
+        app = find_app(app_name)
+        # Snapshot the dial_data under the lock, the string is built unlocked
+        dial_data_items = list(app.dial_data.items()) if app else None
+    finally:
+        APPS_LOCK.release()
     if not app:
         server.call_error(404, 'Not found')
-        MUTEX.release()
         return
-    dial_data = ''
     try:
-        for key, value in app.dial_data.items():
-            dial_data += '\r\n    <{key}>{value}</{key}>'.format(
-                key=utils.url_decode_xml_encode(key),
-                value=utils.url_decode_xml_encode(value)
-            )
+        # One join instead of quadratic str += accumulation; the local alias
+        # skips the module attribute load per item
+        enc = utils.url_decode_xml_encode
+        dial_data = ''.join('\r\n    <{key}>{value}</{key}>'.format(key=enc(key), value=enc(value))
+                            for key, value in dial_data_items)
     except Exception as exc:
         LOGGER.error('handle_app_status error {} with data {}', exc, app.dial_data)
         server.call_error(500, '500 Internal Server Error')
-        MUTEX.release()
         return
     if utils.get_string_size(dial_data) > DIAL_DATA_SIZE:
         LOGGER.error('Exceeded maximum size for dial_data')
         server.call_error(500, '500 Internal Server Error')
-        MUTEX.release()
         return
     local_state = app.dial_cb_status()
     app.state = local_state
@@ -256,32 +307,33 @@ def handle_app_status(server, app_name, origin_header):
         dial_state = 'running'
     else:
         dial_state = 'stopped'
-    server.call_response(STATUS_RESPONSE.format(
-        origin=origin_header,
-        dial_version=DIAL_VERSION,
-        app_name=app_name,
-        can_stop='true',  # We support the DELETE operation
-        dial_state=dial_state,
-        link='' if local_state == DialStatus.STOPPED else '\r\n  <link rel="run" href="run"/>',
-        dial_data=dial_data + '\r\n  '
+    server.call_response(STATUS_RESPONSE % (
+        str(origin_header).encode('utf-8'),
+        DIAL_VERSION.encode('ascii'),
+        app_name.encode('utf-8'),
+        b'true',  # We support the DELETE operation
+        dial_state.encode('ascii'),
+        b'' if local_state == DialStatus.STOPPED else b'\r\n  <link rel="run" href="run"/>',
+        dial_data.encode('utf-8') + b'\r\n  '
     ))
-    MUTEX.release()
 
 
 def handle_app_start(server, app_name, origin_header):
     additional_data_param = None
-    if not MUTEX.acquire(False):
+    if not APPS_LOCK.acquire(timeout=LOCK_TIMEOUT_SECS):
         server.call_error(500, '500 Internal Server Error')
         return
-    app = find_app(app_name)
+    try:
+        app = find_app(app_name)
+    finally:
+        APPS_LOCK.release()
     if not app:
         server.call_error(404, 'Not found')
-        MUTEX.release()
         return
     elif server.body_data_size > DIAL_MAX_PAYLOAD:
         server.call_error(413, '413 Request Entity Too Large')
     # Checks if a payload string contains invalid characters (unprintable or non-ASCII character)
-    elif not utils.is_ascii(server.body_data):
+    elif not server.body_data.isascii():
         server.call_error(400, '400 Bad Request')
     else:
         if app.USE_ADDITIONAL_DATA:
@@ -289,16 +341,18 @@ def handle_app_start(server, app_name, origin_header):
             additional_data_param = 'http://127.0.0.1:{port}/apps/{app_name}/dial_data'.format(
                 port=G.DIAL_SERVER_PORT,
                 app_name=app_name)
-            if utils.get_string_size(additional_data_param) > DIAL_MAX_ADDITIONALURL:
+            # The URL is built from pure-ASCII parts, len() equals the byte size
+            if len(additional_data_param) > DIAL_MAX_ADDITIONALURL:
                 LOGGER.error('Exceeded maximum size for additional_data_param')
                 server.call_error(500, '500 Internal Server Error')
-                MUTEX.release()
                 return
         payload = server.body_data.decode('utf-8')
         LOGGER.debug('Starting app {} with params {}', app_name, payload)
-        app.state = app.dial_cb_start(deepcopy(payload), server.query_params, additional_data_param)
+        # The payload is an immutable str, no defensive copy is needed
+        app.state = app.dial_cb_start(payload, server.query_params, additional_data_param)
         if app.state == DialStatus.RUNNING:
-            server.call_response(CREATED_RESPONSE.format(
+            server.call_response(fill(
+                CREATED_RESPONSE,
                 address=kodi_ops.get_local_ip(),
                 dial_port=G.DIAL_SERVER_PORT,
                 app_name=app_name,
@@ -313,14 +367,16 @@ def handle_app_start(server, app_name, origin_header):
             server.call_error(501, '501 Not Implemented')
         else:
             server.call_error(503, '503 Service Unavailable')
-    MUTEX.release()
 
 
 def handle_app_stop(server, app_name, origin_header):
-    if not MUTEX.acquire(False):
+    if not APPS_LOCK.acquire(timeout=LOCK_TIMEOUT_SECS):
         server.call_error(500, '500 Internal Server Error')
         return
-    app = find_app(app_name)
+    try:
+        app = find_app(app_name)
+    finally:
+        APPS_LOCK.release()
     if app:
         app.state = app.dial_cb_status()
     if not app or app.state == DialStatus.STOPPED:
@@ -328,15 +384,17 @@ def handle_app_stop(server, app_name, origin_header):
     else:
         app.dial_cb_stop()
         app.state = DialStatus.STOPPED
-        server.call_response(STOP_RESPONSE.format(origin=origin_header))
-    MUTEX.release()
+        server.call_response(fill(STOP_RESPONSE, origin=origin_header))
 
 
 def handle_app_hide(server, app_name, origin_header):
-    if not MUTEX.acquire(False):
+    if not APPS_LOCK.acquire(timeout=LOCK_TIMEOUT_SECS):
         server.call_error(500, '500 Internal Server Error')
         return
-    app = find_app(app_name)
+    try:
+        app = find_app(app_name)
+    finally:
+        APPS_LOCK.release()
     if app:
         app.state = app.dial_cb_status()
     if not app or (app.state != DialStatus.RUNNING and app.state != DialStatus.HIDE):
@@ -349,76 +407,75 @@ def handle_app_hide(server, app_name, origin_header):
             server.call_error(501, '501 Not Implemented')
         else:
             app.state = DialStatus.HIDE
-            server.call_response(RESPONSE_OK.format(origin=origin_header))
-    MUTEX.release()
+            server.call_response(fill(RESPONSE_OK, origin=origin_header))
 
 
 def handle_dial_data(server, app_name, origin_header, use_payload):
-    if not MUTEX.acquire(False):
+    if not APPS_LOCK.acquire(timeout=LOCK_TIMEOUT_SECS):
         server.call_error(500, '500 Internal Server Error')
         return
-    app = find_app(app_name)
+    try:
+        app = find_app(app_name)
+    finally:
+        APPS_LOCK.release()
     if app:
         app.state = app.dial_cb_status()
     if not app:
         server.call_error(404, 'Not found')
-        MUTEX.release()
         return
     if not use_payload:
-        data = urlparse(server.path).query
-        if utils.get_string_size(data) > DIAL_DATA_MAX_PAYLOAD:
+        data = server.parsed_url.query
+        if len(data) > DIAL_DATA_MAX_PAYLOAD:
             server.call_error(413, '413 Request Entity Too Large')
-            MUTEX.release()
             return
     else:
         if server.body_data_size > DIAL_DATA_MAX_PAYLOAD:
             server.call_error(413, '413 Request Entity Too Large')
-            MUTEX.release()
             return
         data = server.body_data
-    if not utils.is_ascii(data):
+    if not data.isascii():
         server.call_error(400, '400 Bad Request')
-        MUTEX.release()
         return
     # Data should be always as HTTP encoded url format
-    parsed_data = urlparse(data.decode('ascii'))
-    dial_data = dict(parse_qs(parsed_data.query))
-    # We remove all the 'list' that enclose the values (generated by parse_qs)
-    for key in dial_data.keys():
-        dial_data[key] = dial_data[key][0]
+    parsed_data = urlparse(data.decode('ascii') if isinstance(data, bytes) else data)
+    # Unwrap the single-item lists generated by parse_qs in one comprehension
+    dial_data = {key: value[0] for key, value in parse_qs(parsed_data.query).items()}
     store_dial_data(app_name, dial_data)
     app.dial_data = dial_data
-    server.call_response(RESPONSE_OK.format(origin=origin_header))
-    MUTEX.release()
+    server.call_response(fill(RESPONSE_OK, origin=origin_header))
 
 
 def is_allowed_origin(origin, app_name):
     LOGGER.debug('Checking {} for {}', origin, app_name)
     if not origin:
         return True
-    if not MUTEX.acquire(False):
+    if not APPS_LOCK.acquire(timeout=LOCK_TIMEOUT_SECS):
         # If we can't check, fail in favor of safety.
         return False
-    result = False
-    for app in APPS:
-        if app_name == app.DIAL_APP_NAME:
-            if app.DIAL_ORIGINS and is_uri_in_list(origin, app.DIAL_ORIGINS):
-                result = True
-                break
-    MUTEX.release()
-    return result
-
-
-def is_uri_in_list(origin, origin_list):
-    if not origin or not origin_list:
+    try:
+        app = find_app(app_name)
+        literal_origins = app._origin_literals if app else None
+        origin_patterns = app._compiled_origins if app else None
+    finally:
+        APPS_LOCK.release()
+    if not literal_origins and not origin_patterns:
+        return False
+    return is_uri_in_list(origin, literal_origins, origin_patterns)
+
+
+def is_uri_in_list(origin, literal_origins, origin_patterns):
+    if not origin:
         return False
-    is_https = origin.startswith('https://')
     # If the URI begins with https://, perform a host comparison because
     # any port numbers must be handled specially. Otherwise perform a regular match.
-    for candidate in origin_list:
-        if (is_https and host_matches(origin, candidate)) or (not is_https and origin_matches(origin, candidate)):
-            return True
-    return False
+    if origin.startswith('https://'):
+        return (any(host_matches(origin, candidate) for candidate in literal_origins)
+                or any(host_matches(origin, pattern.pattern) for pattern in origin_patterns))
+    # The literal origins retire with a set membership test, only the origins
+    # with regex metacharacters pay the regex engine
+    if origin in literal_origins:
+        return True
+    return any(origin_matches(origin, pattern) for pattern in origin_patterns)
 
 
 def host_matches(origin, candidate):
@@ -427,7 +484,13 @@ def host_matches(origin, candidate):
 
 
 def origin_matches(origin, candidate):
-    return re.match(candidate, origin)
+    return candidate.match(origin)
+
+
+@lru_cache(maxsize=256)
+def _compile_origin(candidate):
+    """Compile an allowed-origin pattern (memoized, for any origin not seen at registration)"""
+    return re.compile(candidate)
 
 
 def find_app(app_name) -> 'DialApp':
@@ -436,7 +499,7 @@ def find_app(app_name) -> 'DialApp':
     :param app_name: the DIAL app name
     :return: the app instance or None if not found
     """
-    return next((_app for _app in APPS if _app.DIAL_APP_NAME == app_name), None)
+    return APPS_BY_NAME.get(app_name)
 
 
 def register_apps(kodi_interface):
@@ -445,7 +508,7 @@ def register_apps(kodi_interface):
     # then for each add-on we try import the "DialApp" class included in the path "resources/lib/dial_app_test/"
     addons = kodi_ops.json_rpc('Addons.GetAddons', {'type': 'unknown',
                                                     'properties': ['name', 'dependencies', 'enabled', 'path']})
-    MUTEX.acquire()
+    APPS_LOCK.acquire()
     # # Clear previous sys modules added
     # for name in list(sys.modules.keys()):
     #     if name.startswith('dial_app_'):
@@ -457,7 +520,19 @@ def register_apps(kodi_interface):
         if any(dep['addonid'] == 'script.appcast' for dep in addon['dependencies']):
             # Try add the DIAL app included in the add-on
             try:
-                name = addon['addonid'].split('.')[-1]
+                addon_id = addon['addonid']
+                # An unchanged module (same path, same mtime) is reused as is,
+                # skipping the two existence stats and the re-exec
+                cached = _MODULE_CACHE.get(addon_id)
+                if cached:
+                    module_path, mtime, module = cached
+                    try:
+                        if os.path.getmtime(module_path) == mtime:
+                            register_app(getattr(module, 'DialApp'), kodi_interface)
+                            continue
+                    except OSError:
+                        pass  # Module file moved or removed, fall back to a full load
+                name = addon_id.split('.')[-1]
                 package = 'dial_app_' + name
                 module_path_folder1 = file_ops.join_folders_paths(addon['path'],
                                                                   package,
@@ -485,12 +560,15 @@ def register_apps(kodi_interface):
                     LOGGER.error('register_apps: "DialApp" class not found in {}.py file of {} add-on',
                                  package, addon['addonid'])
                     continue
+                try:
+                    _MODULE_CACHE[addon_id] = (module_path, os.path.getmtime(module_path), module)
+                except OSError:
+                    pass  # Not cacheable, the next register_apps call reloads it
                 register_app(app_class, kodi_interface)
             except Exception:
                 LOGGER.error('register_apps: could not import the DIAL app from {}', addon['addonid'])
-                import traceback
                 LOG.error(traceback.format_exc())
-    MUTEX.release()
+    APPS_LOCK.release()
 
 
 def register_internal_apps(kodi_interface):
@@ -498,7 +576,7 @@ def register_internal_apps(kodi_interface):
     # The DIAL apps will be loaded from "resources/lib/apps" sub-folders
     directory_base = file_ops.join_folders_paths(G.ADDON_DATA_PATH, 'resources/lib/apps')
     dirs, _ = file_ops.list_dir(directory_base)
-    MUTEX.acquire()
+    APPS_LOCK.acquire()
     for dir_name in dirs:
         try:
             if dir_name.startswith('_') or dir_name == 'dial_app_test':
@@ -516,9 +594,8 @@ def register_internal_apps(kodi_interface):
             register_app(app_class, kodi_interface)
         except Exception:
             LOGGER.error('register_internal_apps: could not import the DIAL app from {} folder', dir_name)
-            import traceback
             LOG.error(traceback.format_exc())
-    MUTEX.release()
+    APPS_LOCK.release()
 
 
 def register_app(app_class: Type['DialApp'], kodi_interface):
@@ -526,7 +603,7 @@ def register_app(app_class: Type['DialApp'], kodi_interface):
         LOGGER.error('register_app: KODI_ADDON_ID or DIAL_APP_NAME not specified on {} app class of {} add-on',
                      app_class.DIAL_APP_NAME, app_class.KODI_ADDON_ID)
         return
-    existing_app = next((_app for _app in APPS if _app.DIAL_APP_NAME == app_class.DIAL_APP_NAME), None)
+    existing_app = APPS_BY_NAME.get(app_class.DIAL_APP_NAME)
     if existing_app:
         LOGGER.warn('register_app: skipped DIAL app {} is already registered by {} add-on',
                     app_class.DIAL_APP_NAME, existing_app.KODI_ADDON_ID)
@@ -536,12 +613,26 @@ def register_app(app_class: Type['DialApp'], kodi_interface):
     else:
         database = None
     _app = app_class(kodi_interface, database)
+    init_callback_table(_app)
+    # Split the allowed origins once: plain strings (re.escape leaves them
+    # unchanged) are matched by set membership, only the ones with regex
+    # metacharacters are compiled and pay the regex engine per request
+    literals = set()
+    patterns = []
+    for candidate in (_app.DIAL_ORIGINS or []):
+        if re.escape(candidate) == candidate:
+            literals.add(candidate)
+        else:
+            patterns.append(_compile_origin(candidate))
+    _app._origin_literals = frozenset(literals)
+    _app._compiled_origins = patterns
     _app.state = DialStatus.STOPPED  # On class init we have to set it as Stopped
     # dial_data: Is a dict where the values cannot contain any spaces.
     #   They are expected to be URL-escaped strings, so any spaces would be represented as the '+' character.
     #   They have a max length of 255 characters.
     _app.dial_data = retrieve_dial_data(_app.DIAL_APP_NAME)
     APPS.append(_app)
+    APPS_BY_NAME[_app.DIAL_APP_NAME] = _app
     LOGGER.info('Registered "{}" DIAL app to "{}" add-on', _app.DIAL_APP_NAME, _app.KODI_ADDON_ID)
 
 
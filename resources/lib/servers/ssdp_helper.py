@@ -7,6 +7,8 @@
     SPDX-License-Identifier: BSD-2-Clause
     See LICENSES/BSD-2-Clause-Netflix.md for more information.
 """
+from resources.lib.helpers.utils import fix_return_chars
+
 # IMPORTANT: Make sure to maintain the header structure with exact spaces between header name and value,
 #            or some mobile apps may not recognise the values correctly.
 # CACHE-CONTROL: max-age Amount of time in seconds that the NOTIFY packet should be cached by clients receiving it
@@ -26,26 +28,32 @@ USN: uuid:{device_uuid}::urn:dial-multiscreen-org:service:dial:1
 
 '''
 
-# Notify that the service is changed
-ADV_UPDATE = '''\
-NOTIFY * HTTP/1.1
-HOST: {udp_ip_addr}:{udp_port}
-CACHE-CONTROL: max-age=1800
-NT: urn:dial-multiscreen-org:service:dial:1
-NTS: ssdp:alive
-LOCATION: http://{ip_addr}:{port}/dd.xml
-USN: uuid:{device_uuid}::urn:dial-multiscreen-org:service:dial:1
+# The advertisement templates are pre-encoded to bytes with printf-style fields
+# (all substituted values are plain ASCII), so rendering one is a single C-level
+# 'template % args' with no str formatting or encode per message
 
+# Notify that the service is changed
+# Fields: udp_ip_addr, udp_port, ip_addr, port, device_uuid
+ADV_UPDATE = b'''\
+NOTIFY * HTTP/1.1\r
+HOST: %b:%d\r
+CACHE-CONTROL: max-age=1800\r
+NT: urn:dial-multiscreen-org:service:dial:1\r
+NTS: ssdp:alive\r
+LOCATION: http://%b:%d/dd.xml\r
+USN: uuid:%b::urn:dial-multiscreen-org:service:dial:1\r
+\r
 '''
 
 # Notify that the service is not available
-ADV_BYEBYE = '''\
-NOTIFY * HTTP/1.1
-HOST: {udp_ip_addr}:{udp_port}
-NT: urn:dial-multiscreen-org:service:dial:1
-NTS: ssdp:byebye
-USN: uuid:{device_uuid}::urn:dial-multiscreen-org:service:dial:1
-
+# Fields: udp_ip_addr, udp_port, device_uuid
+ADV_BYEBYE = b'''\
+NOTIFY * HTTP/1.1\r
+HOST: %b:%d\r
+NT: urn:dial-multiscreen-org:service:dial:1\r
+NTS: ssdp:byebye\r
+USN: uuid:%b::urn:dial-multiscreen-org:service:dial:1\r
+\r
 '''
 
 # Device descriptor XML
@@ -70,3 +78,11 @@ Application-URL: http://{ip_addr}:{dial_port}/apps/
 </root>
 
 '''
+
+# The str templates above are written with plain newlines for readability, here
+# they are normalized once to the CRLF line endings required on the wire, so the
+# senders do not need to run the fix_return_chars scan on every packet
+# (the substituted field values never contain return chars; the byte templates
+# are already written with CRLF endings)
+SEARCH_RESPONSE = fix_return_chars(SEARCH_RESPONSE)
+DD_XML = fix_return_chars(DD_XML)
@@ -7,19 +7,94 @@
     SPDX-License-Identifier: BSD-2-Clause
     See LICENSES/BSD-2-Clause-Netflix.md for more information.
 """
+import atexit
+import ctypes
+import ctypes.util
+import random
+import re
 import socket
+import struct
+import sys
+import threading
+import time
+import traceback
 from email.utils import formatdate
-from socketserver import DatagramRequestHandler, ThreadingUDPServer
+from socketserver import UDPServer
 
 import resources.lib.servers.ssdp_helper as ssdp_msgs
 from resources.lib.globals import G
+# NOTE: kodi_ops.get_local_ip answers from a short-TTL cache, so calling it per
+# datagram/advertisement does not pay the xbmc roundtrip on discovery bursts
 from resources.lib.helpers import kodi_ops
-from resources.lib.helpers import utils
 from resources.lib.helpers.logging import GetLogger, LOG
 
 # LOGGER = GetLogger('SSDP-Server', LOG.TYPE_SSDP_SERVER)
 LOGGER_UDP = GetLogger('SSDP-UDP-Server', LOG.TYPE_SSDP_SERVER)
 
+# The M-SEARCH reply pre-rendered/encoded and split around the DATE header value,
+# the only field that changes per request; rebuilt only when the key fields change
+_SEARCH_RESP_CACHE = [None, b'', b'']  # [key, prefix, suffix]
+
+# Single-pass filter for the datagrams of interest: most SSDP traffic is noise
+# from other services, one C-level regex scan rejects it faster than the
+# separate startswith + substring scans
+_MSEARCH_RE = re.compile(b'\\AM-SEARCH .*urn:dial-multiscreen-org:service:dial:1', re.DOTALL)
+
+# The socket option feature probes are done once at import time, instead of a
+# hasattr check on every socket setup (None where the platform lacks the option)
+_SO_REUSEADDR = getattr(socket, 'SO_REUSEADDR', None)
+_SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', None)
+
+# Extracts the MX header value (maximum wait in seconds) from an M-SEARCH request
+_MX_RE = re.compile(rb'^MX:\s*(\d+)', re.M | re.I)
+
+# Clients with a reply already scheduled within their MX window, keyed by the
+# client address: duplicate M-SEARCH retries arriving in the window are dropped,
+# as the UPnP spec intends, instead of answering every copy of the flood
+_PENDING_REPLIES = {}
+_PENDING_LOCK = threading.Lock()
+
+# The packed ip_mreq for the multicast group join, rebuilt only when the local
+# IP changes (the server is re-bound on network changes)
+_MREQ_CACHE = [None, b'']  # [local ip, packed ip_mreq]
+
+
+def _get_mreq():
+    """Return the packed ip_mreq struct for the multicast membership"""
+    ip_addr = kodi_ops.get_local_ip()
+    if _MREQ_CACHE[0] != ip_addr:
+        _MREQ_CACHE[:] = [ip_addr, struct.pack('=4s4s',
+                                               socket.inet_aton(G.SSDP_BROADCAST_ADDR),
+                                               socket.inet_aton(ip_addr))]
+    return _MREQ_CACHE[1]
+
+# The HTTP date has 1-second resolution, memoize the formatted bytes per second
+# so discovery bursts do not re-run formatdate/encode for every datagram
+_DATE_CACHE = [0, b'']  # [unix second, formatted date bytes]
+
+
+def _get_date_bytes():
+    """Return the current HTTP date as ascii bytes (cached at 1-second granularity)"""
+    now = int(time.time())
+    if now != _DATE_CACHE[0]:
+        _DATE_CACHE[:] = [now, formatdate(now, localtime=False, usegmt=True).encode('ascii')]
+    return _DATE_CACHE[1]
+
+
+def _get_search_response_parts():
+    """Return the (prefix, suffix) byte parts of the M-SEARCH reply message"""
+    key = (kodi_ops.get_local_ip(), G.DIAL_SERVER_PORT, G.DEVICE_UUID, G.sp_upnp_boot_id)
+    if _SEARCH_RESP_CACHE[0] != key:
+        rendered = ssdp_msgs.SEARCH_RESPONSE.format(
+            ip_addr=key[0],
+            port=key[1],  # G.SSDP_SERVER_PORT,
+            date_timestamp='\x00DATE\x00',
+            device_uuid=key[2],
+            boot_id=key[3]
+        ).encode('ascii')
+        _SEARCH_RESP_CACHE[:] = [key, *rendered.split(b'\x00DATE\x00')]
+    return _SEARCH_RESP_CACHE[1], _SEARCH_RESP_CACHE[2]
+
 
 # This server return only the device descriptor xml, in order to save resources this has been moved to dial server.
 #   the code has been preserved by reference to the original source code
@@ -54,90 +129,251 @@ LOGGER_UDP = GetLogger('SSDP-UDP-Server', LOG.TYPE_SSDP_SERVER)
 #         """Override method to disable the BaseHTTPServer Log"""
 
 
-class SSDPUDPServer(ThreadingUDPServer):
+class SSDPUDPServer(UDPServer):
     """SSDP UDP Broadcast Server"""
+    # The datagrams are tiny stateless M-SEARCH requests answered with one send,
+    # served in-line on the shared service reactor: a thread per datagram
+    # (ThreadingUDPServer) would cost more in create/teardown than the handling
     def __init__(self):
-        super().__init__(('', G.SSDP_UPNP_PORT), SSDPUDPHandler)
+        # No handler class: finish_request dispatches to a free function instead
+        # of instantiating a request-handler object per datagram
+        super().__init__(('', G.SSDP_UPNP_PORT), None)
 
     def server_bind(self):
         try:  # Allow multiple sockets to use the same port
-            if hasattr(socket, "SO_REUSEADDR"):
-                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if _SO_REUSEADDR is not None:
+                self.socket.setsockopt(socket.SOL_SOCKET, _SO_REUSEADDR, 1)
         except Exception as exc:
             LOGGER_UDP.error('Set socket option SO_REUSEADDR error: {}', exc)
+        try:  # Let the kernel hash datagrams across sockets bound to the same port,
+            # so other UPnP services (or future extra listeners) can coexist on 1900
+            if _SO_REUSEPORT is not None:
+                self.socket.setsockopt(socket.SOL_SOCKET, _SO_REUSEPORT, 1)
+        except Exception as exc:
+            LOGGER_UDP.error('Set socket option SO_REUSEPORT error: {}', exc)
         self.socket.bind(('0.0.0.0', G.SSDP_UPNP_PORT))
-        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
-                               socket.inet_aton(G.SSDP_BROADCAST_ADDR) + socket.inet_aton(kodi_ops.get_local_ip()))
+        self._join_multicast_group()
         # Alternative, but sometimes happen that not receive anymore messages (at least on Windows)
         # self.server_bind()
         # group = socket.inet_aton(G.SSDP_BROADCAST_ADDR)
         # mreq = struct.pack('=4sl', group, socket.INADDR_ANY)
         # self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
+    def _join_multicast_group(self):
+        """Join the SSDP multicast group, on every suitable interface where supported"""
+        # Joining by interface index (struct ip_mreqn: group, INADDR_ANY, index)
+        # does not depend on get_local_ip resolving the right/current address and
+        # covers multi-homed devices; platforms without if_nameindex or that
+        # reject the 12-byte mreqn fall back to the classic per-IP join
+        joined = set()
+        if hasattr(socket, 'if_nameindex'):
+            group = socket.inet_aton(G.SSDP_BROADCAST_ADDR)
+            try:
+                interfaces = socket.if_nameindex()
+            except OSError:
+                interfaces = []
+            for if_index, if_name in interfaces:
+                if if_name.startswith('lo') or (G.SSDP_BROADCAST_ADDR, if_index) in joined:
+                    continue
+                mreqn = struct.pack('=4s4si', group, b'\x00\x00\x00\x00', if_index)
+                try:
+                    self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreqn)
+                    joined.add((G.SSDP_BROADCAST_ADDR, if_index))
+                except OSError as exc:
+                    LOGGER_UDP.debug('Multicast join failed on interface {}: {}', if_name, exc)
+        if not joined:
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _get_mreq())
+        self._joined_groups = joined
+
     def server_close(self):
-        # We notify the clients
-        send_advertisement(ssdp_msgs.ADV_BYEBYE)
-
-
-class SSDPUDPHandler(DatagramRequestHandler):
-    """Handles SSDP UDP datagram requests"""
-    def handle(self):
-        try:
-            request_data = self.rfile.read()
-            # LOGGER.debug('Received message from address: {}; Data:\n{}', self.client_address, request_data)
-            # Todo: check MX value and wait until about half of timeout, and ignore all others same requests
-            if request_data.startswith(b'M-SEARCH') and b'urn:dial-multiscreen-org:service:dial:1' in request_data:
-                LOGGER_UDP.debug('Received [M-SEARCH] message from address: {}; Data:\n{}',
-                                 self.client_address, request_data)
-                # Build the M-SEARCH response message
-                response_data = ssdp_msgs.SEARCH_RESPONSE.format(
-                    ip_addr=kodi_ops.get_local_ip(),
-                    port=G.DIAL_SERVER_PORT,  # G.SSDP_SERVER_PORT,
-                    date_timestamp=formatdate(timeval=None, localtime=False, usegmt=True),
-                    device_uuid=G.DEVICE_UUID,
-                    boot_id=G.sp_upnp_boot_id
-                )
-                # Send reply to the client
-                LOGGER_UDP.debug('Sending reply message to {}; Data:\n{}', self.client_address, response_data)
-                self.wfile.write(utils.fix_return_chars(response_data).encode('ascii'))
-                # G.sp_upnp_boot_id += 1
-        except Exception as exc:
-            LOGGER_UDP.error('An error occurred while processing the request\nError: {}\nAddress: {}',
-                             exc, self.client_address)
+        # We notify the clients (UDP is lossy, ssdp:byebye is conventionally
+        # repeated; the copies go out batched in one syscall where supported)
+        send_advertisement(ssdp_msgs.ADV_BYEBYE, repeat=2)
 
+    def finish_request(self, request, client_address):
+        _maybe_reply(request[1], request[0], client_address)
 
-def send_advertisement(message):
-    """Broadcast SSDP message"""
-    # NOTICE: These messages are not handled by all mobile apps,
-    #         some apps handle server status changes "themselves" and other apps wait these messages,
-    #         all standard UPnP header fields seem not required
+    def handle_error(self, request, client_address):
+        # Programming errors in the datagram handling propagate here, the
+        # default socketserver hook would print to stderr instead of the Kodi log
+        LOGGER_UDP.error('An error occurred while processing the request\nAddress: {}\n{}',
+                         client_address, traceback.format_exc())
+
+
+def _maybe_reply(sock, request_data, client_address):
+    """Reply to a DIAL M-SEARCH datagram, everything else is ignored"""
+    # No try/except on the per-packet path: the parsing below is pure and cannot
+    # fail on untrusted input, programming errors propagate to the server
+    # handle_error hook; only the sends guard against real network failures
+    # LOGGER.debug('Received message from address: {}; Data:\n{}', client_address, request_data)
+    if not _MSEARCH_RE.match(request_data):
+        return
+    if LOGGER_UDP.is_debug_enabled:  # Skip even the no-op call under floods
+        LOGGER_UDP.debug('Received [M-SEARCH] message from address: {}; Data:\n{}',
+                         client_address, request_data)
+    mx_match = _MX_RE.search(request_data)
+    if not mx_match:
+        # No MX header, answer immediately
+        _send_search_reply(sock, client_address)
+        return
+    with _PENDING_LOCK:
+        if client_address in _PENDING_REPLIES:
+            # A reply to this client is already scheduled, drop the duplicate
+            return
+        _PENDING_REPLIES[client_address] = True
+    # Jitter the reply within half the MX window (capped at 3s) per UPnP rules,
+    # duplicates retried by the client in the meantime coalesce in to one reply
+    delay = random.uniform(0, min(int(mx_match.group(1)), 3) / 2)
+    timer = threading.Timer(delay, _send_search_reply, (sock, client_address, True))
+    timer.daemon = True
+    timer.start()
+    # G.sp_upnp_boot_id += 1
+
+
+def _send_search_reply(sock, client_address, clear_pending=False):
+    """Build and send the M-SEARCH reply (also run by the MX jitter timers)"""
+    if clear_pending:
+        with _PENDING_LOCK:
+            _PENDING_REPLIES.pop(client_address, None)
+    # Build the M-SEARCH response message by splicing the date in to
+    # the pre-rendered reply (two concatenations, no format parsing)
+    prefix, suffix = _get_search_response_parts()
+    response_data = prefix + _get_date_bytes() + suffix
+    # Send reply to the client
+    if LOGGER_UDP.is_debug_enabled:
+        LOGGER_UDP.debug('Sending reply message to {}; Data:\n{}', client_address, response_data)
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
+        sock.sendto(response_data, client_address)
+    except OSError as exc:
+        LOGGER_UDP.error('An error occurred while sending the reply\nError: {}\nAddress: {}',
+                         exc, client_address)
+
+
+# On Linux the repeated advertisement datagrams are batched in a single sendmmsg
+# syscall instead of one sendto each (on other platforms or if libc cannot be
+# loaded, _send_datagrams falls back to a plain send loop)
+if sys.platform.startswith('linux'):
+    class _IOVec(ctypes.Structure):  # struct iovec
+        _fields_ = [('iov_base', ctypes.c_void_p),
+                    ('iov_len', ctypes.c_size_t)]
+
+    class _MsgHdr(ctypes.Structure):  # struct msghdr
+        _fields_ = [('msg_name', ctypes.c_void_p),
+                    ('msg_namelen', ctypes.c_uint),
+                    ('msg_iov', ctypes.POINTER(_IOVec)),
+                    ('msg_iovlen', ctypes.c_size_t),
+                    ('msg_control', ctypes.c_void_p),
+                    ('msg_controllen', ctypes.c_size_t),
+                    ('msg_flags', ctypes.c_int)]
+
+    class _MMsgHdr(ctypes.Structure):  # struct mmsghdr
+        _fields_ = [('msg_hdr', _MsgHdr),
+                    ('msg_len', ctypes.c_uint)]
+
+    try:
+        _SENDMMSG = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True).sendmmsg
+    except (OSError, AttributeError):
+        _SENDMMSG = None
+else:
+    _SENDMMSG = None
+
+
+def _send_datagrams(sock, payloads):
+    """Send the datagram payloads on a connected socket, batched in one syscall where possible"""
+    if _SENDMMSG is None or len(payloads) == 1:
+        for payload in payloads:
+            sock.sendall(payload)
+        return
+    count = len(payloads)
+    # The buffers must be kept referenced until the syscall returns
+    buffers = [ctypes.create_string_buffer(payload, len(payload)) for payload in payloads]
+    iovecs = (_IOVec * count)()
+    msgs = (_MMsgHdr * count)()
+    for idx in range(count):
+        iovecs[idx].iov_base = ctypes.cast(buffers[idx], ctypes.c_void_p)
+        iovecs[idx].iov_len = len(payloads[idx])
+        msgs[idx].msg_hdr.msg_iov = ctypes.pointer(iovecs[idx])
+        msgs[idx].msg_hdr.msg_iovlen = 1
+    if _SENDMMSG(sock.fileno(), msgs, count, 0) < 0:
+        raise socket.error(ctypes.get_errno(), 'sendmmsg failed')
+
+
+# The advertisement field tuples are frozen here and rebuilt only when the
+# local IP changes, everything else is fixed for the process lifetime
+_ADV_ARGS_CACHE = [None, (), ()]  # [local ip, ADV_UPDATE args, ADV_BYEBYE args]
+
+
+def _adv_args(message):
+    """Return the field values for an advertisement byte template, in template order"""
+    ip_addr = kodi_ops.get_local_ip()
+    if _ADV_ARGS_CACHE[0] != ip_addr:
+        bcast_addr = G.SSDP_BROADCAST_ADDR.encode('ascii')
+        device_uuid = G.DEVICE_UUID.encode('ascii')
+        _ADV_ARGS_CACHE[:] = [ip_addr,
+                              (bcast_addr, G.SSDP_UPNP_PORT, ip_addr.encode('ascii'),
+                               G.DIAL_SERVER_PORT,  # G.SSDP_SERVER_PORT,
+                               device_uuid),
+                              (bcast_addr, G.SSDP_UPNP_PORT, device_uuid)]
+    return _ADV_ARGS_CACHE[2] if message is ssdp_msgs.ADV_BYEBYE else _ADV_ARGS_CACHE[1]
+
+
+# Reusable pre-configured multicast socket for the advertisement messages,
+# created lazily once instead of paying open/setsockopt/connect/close per message
+_ADV_SOCK = None
+_ADV_SOCK_LOCK = threading.Lock()
+
+
+def _get_adv_socket():
+    """Return the shared pre-configured multicast socket for the advertisements"""
+    global _ADV_SOCK  # pylint: disable=global-statement
+    with _ADV_SOCK_LOCK:
+        if _ADV_SOCK is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
             try:  # Allow multiple sockets to use the same port
-                if hasattr(socket, "SO_REUSEADDR"):
-                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if _SO_REUSEADDR is not None:
+                    sock.setsockopt(socket.SOL_SOCKET, _SO_REUSEADDR, 1)
             except Exception as exc:
                 LOGGER_UDP.error('Set socket option SO_REUSEADDR error: {}', exc)
             sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
             sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
             sock.settimeout(3)
             sock.connect((G.SSDP_BROADCAST_ADDR, G.SSDP_UPNP_PORT))
-            # Fill the key parameters of the message
-            # (we add all the keys for all types of messages, only those needed for the message will be taken)
-            data = message.format_map(utils.FormatMapSubCls(
-                udp_ip_addr=G.SSDP_BROADCAST_ADDR,
-                udp_port=G.SSDP_UPNP_PORT,
-                ip_addr=kodi_ops.get_local_ip(),
-                port=G.DIAL_SERVER_PORT,  # G.SSDP_SERVER_PORT,
-                device_uuid=G.DEVICE_UUID
-            ))
-            sock.sendall(utils.fix_return_chars(data).encode('ascii'))
-            LOGGER_UDP.debug('Sent advertisement message with data:\n{}', data)
+            atexit.register(sock.close)
+            _ADV_SOCK = sock
+        return _ADV_SOCK
+
+
+def _reset_adv_socket():
+    """Close the shared advertisement socket, it will be recreated on the next use"""
+    global _ADV_SOCK  # pylint: disable=global-statement
+    with _ADV_SOCK_LOCK:
+        if _ADV_SOCK is not None:
+            try:
+                atexit.unregister(_ADV_SOCK.close)
+                _ADV_SOCK.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            _ADV_SOCK = None
+
+
+def send_advertisement(message, repeat=1):
+    """Broadcast SSDP message, optionally repeated in a single syscall batch"""
+    # NOTICE: These messages are not handled by all mobile apps,
+    #         some apps handle server status changes "themselves" and other apps wait these messages,
+    #         all standard UPnP header fields seem not required
+    try:
+        # Fill the key parameters of the message: the templates are pre-encoded
+        # bytes with printf-style fields, one C-level '%' render per message
+        payload = message % _adv_args(message)
+        _send_datagrams(_get_adv_socket(), [payload] * repeat)
+        LOGGER_UDP.debug('Sent advertisement message (x{}) with data:\n{}', repeat, payload)
     except socket.timeout as exc:
         LOGGER_UDP.error('Socket timeout error on send advertisement message')
         LOGGER_UDP.debug('Error: {}\nOn sending data:\n{}', exc, message)
+        _reset_adv_socket()
     except socket.error as exc:
         LOGGER_UDP.error('Socket error on send advertisement message')
         LOGGER_UDP.debug('Error: {}\nOn sending data:\n{}', exc, message)
+        _reset_adv_socket()
     except Exception as exc:
         LOGGER_UDP.error('Error: {}\nOn sending data:\n{}', exc, message)